@@ -61,9 +61,15 @@ const PDFUploader = ({ onUploadComplete }) => {
       // 1. Upload to Appwrite Storage
       const uploadResult = await authService.uploadPDF(file);
       
-      // 2. Upload to AI backend for indexing
-      await apiService.uploadPDF(file, userData.$id, file.name);
-      console.log('PDF uploaded to AI backend:', userData.$id, file.name);
+      // 2. Upload to AI backend and wait for the background indexing job
+      const { job_id } = await apiService.uploadPDF(file, userData.$id, file.name);
+      console.log('PDF uploaded to AI backend:', userData.$id, file.name, job_id);
+      clearInterval(progressInterval);
+      await apiService.waitForJob(job_id, (job) => {
+        if (job.chunks_total > 0) {
+          setProgress(Math.min(99, (100 * job.chunks_embedded) / job.chunks_total));
+        }
+      });
       
       setProgress(100);
       setSuccess(`Successfully uploaded ${file.name}`);
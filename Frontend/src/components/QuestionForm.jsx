@@ -26,8 +26,9 @@ const QuestionForm = ({ bookName, userId, onAnswerReceived }) => {
     setError('');
     
     try {
-      // Get answer from AI backend
-      const responseAnswer = await apiService.askQuestion(userId, bookName, question);
+      // Stream the answer from the AI backend as it is generated
+      setAnswer('');
+      const responseAnswer = await apiService.askQuestionStream(userId, bookName, question, setAnswer);
       setAnswer(responseAnswer);
       
       // Save Q&A pair to Appwrite
@@ -28,6 +28,28 @@ class APIService {
     }
   }
 
+  // 1b) Poll an indexing job started by uploadPDF
+  async getJob(jobId) {
+    try {
+      const response = await this.client.get(`/jobs/${jobId}`);
+      return response.data;
+    } catch (error) {
+      console.error('Error fetching job status:', error.response?.data || error);
+      throw error;
+    }
+  }
+
+  // Resolves once the job is finished, reporting progress along the way
+  async waitForJob(jobId, onProgress, intervalMs = 1000) {
+    for (;;) {
+      const job = await this.getJob(jobId);
+      if (onProgress) onProgress(job);
+      if (job.stage === 'failed') throw new Error(job.error || 'Indexing failed');
+      if (job.stage === 'done' || job.stage === 'skipped') return job;
+      await new Promise((resolve) => setTimeout(resolve, intervalMs));
+    }
+  }
+
   // 2) List books
   async listBooks(userId) {
     try {
@@ -54,6 +76,46 @@ class APIService {
       throw error;
     }
   }
+
+  // 3b) Ask a question and receive the answer as it is generated (Server-Sent Events).
+  // onToken is called with each piece of text; resolves with the full answer.
+  async askQuestionStream(userId, bookName, query, onToken) {
+    const response = await fetch('/questions/stream', {
+      method:  'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body:    JSON.stringify({ user_id: userId, book_name: bookName, query }),
+    });
+    if (!response.ok) {
+      const error = new Error(`Request failed with status ${response.status}`);
+      error.response = { status: response.status, data: await response.json().catch(() => null) };
+      throw error;
+    }
+
+    const reader  = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    let answer = '';
+    for (;;) {
+      const { value, done } = await reader.read();
+      if (done) break;
+      buffer += decoder.decode(value, { stream: true });
+      const events = buffer.split('\n\n');
+      buffer = events.pop();
+      for (const raw of events) {
+        const event = raw.match(/^event: (.*)$/m)?.[1];
+        const data  = JSON.parse(raw.match(/^data: (.*)$/m)?.[1] || '{}');
+        if (event === 'token') {
+          answer += data.text;
+          if (onToken) onToken(answer);
+        } else if (event === 'error') {
+          throw new Error(data.detail);
+        } else if (event === 'done') {
+          console.log('Answer timings:', data);
+        }
+      }
+    }
+    return answer.trim();
+  }
 }
 
 export default new APIService();
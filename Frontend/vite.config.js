@@ -18,6 +18,11 @@ export default ({ mode }) => {
           changeOrigin: true,
           secure: false,
         },
+        '/jobs/': {
+          target: env.VITE_API_URL,
+          changeOrigin: true,
+          secure: false,
+        },
       },
     },
   });
@@ -1,14 +1,33 @@
 import os as os
-import fitz                           # PyMuPDF
+import json
+import time
+import asyncio
+import hashlib
+import tempfile
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
-from fastapi import FastAPI, UploadFile, File, Form, HTTPException
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from starlette.background import BackgroundTask
+from starlette.datastructures import MutableHeaders
 from pydantic import BaseModel
-from typing import List
+from typing import AsyncIterator, Awaitable, Iterator, List, Optional, Tuple, TypeVar
 from dotenv import load_dotenv
-import google.generativeai as genai
-import time
-from pinecone import Pinecone, ServerlessSpec
+from vector_store import DIMENSION, delete_book_vectors, get_store, namespace_for
+from ingest import ingest_book
+from catalog import get_catalog
+from chunk_store import get_chunk_store
+import jobs
+import qa_cache
+import bm25
+import retrieval
+import metrics
+import gemini
+import batch_qa
+import scheduler
+from scheduler import BULK, INTERACTIVE
 
 # === Load .env ===
 load_dotenv()
@@ -16,21 +35,37 @@ load_dotenv()
 # === FastAPI app ===
 app = FastAPI(title="📚 Gemini Book Bot API")
 
+# adds a Server-Timing header with the time spent per pipeline stage to every response
+TIMING_HEADERS = os.getenv("TIMING_HEADERS", "").lower() in ("1", "true", "yes")
+
+# The question endpoints are async: Gemini calls are awaited on the event loop and
+# only retrieval (BM25, the vector store client, the chunk store) runs in this
+# pool, so a slow answer holds no thread and concurrency is not capped by
+# FastAPI's threadpool.
+API_RETRIEVAL_WORKERS = int(os.getenv("API_RETRIEVAL_WORKERS", "64"))
+RETRIEVAL_TIMEOUT     = float(os.getenv("RETRIEVAL_TIMEOUT", "15"))   # seconds
+DISCONNECT_POLL       = 0.25                                        # seconds between client disconnect checks
+retrieval_pool = ThreadPoolExecutor(max_workers=API_RETRIEVAL_WORKERS, thread_name_prefix="retrieve")
+
+# uploads are stored once per content, as {UPLOAD_DIR}/{sha256}.pdf
+UPLOAD_DIR        = os.getenv("UPLOAD_DIR", "uploads")
+UPLOAD_BLOCK_SIZE = 1 << 20                                         # bytes copied and hashed per step
+# re-queue ingestions interrupted by a restart; turn off on all but one process
+# when several API processes share the catalog
+RESUME_INGESTION  = os.getenv("RESUME_INGESTION", "1").lower() in ("1", "true", "yes")
+# seconds a client turned away for having JOB_USER_LIMIT books queued is told to wait
+UPLOAD_RETRY_AFTER = int(os.getenv("UPLOAD_RETRY_AFTER", "60"))
+
 # === Delete chunks function ===
-def delete_chunks(user_id: str, book_name: str) -> bool:
-    # Query all chunk ids for the user and book
-    results = index.query(
-        vector=[0.0] * DIMENSION,
-        top_k=1000,
-        include_metadata=False,
-        filter={"user_id": user_id, "book_name": book_name}
-    )
-    ids_to_delete = [match.id for match in results.matches]
-    if not ids_to_delete:
-        return False
-    # Delete all chunks by ids
-    index.delete(ids=ids_to_delete)
-    return True
+def delete_chunks(user_id: str, book_name: str) -> Tuple[int, float]:
+    # Deletes every chunk of the book in parallel batches; returns (vectors deleted, seconds)
+    deleted, seconds = delete_book_vectors(get_store(), user_id, book_name,
+                                           get_catalog().chunk_extent(user_id, book_name))
+    get_catalog().remove_book(user_id, book_name)
+    get_chunk_store().delete_book(user_id, book_name)
+    bm25.remove(user_id, book_name)
+    logger.info(f"Deleted {deleted} vectors for '{book_name}' ({user_id}) in {seconds:.2f}s")
+    return deleted, seconds
 
 # Add CORS middleware
 origins = [
@@ -43,89 +78,154 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing"],
 )
 
-# === Gemini config ===
-GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-if not GEMINI_API_KEY:
-    raise RuntimeError("GEMINI_API_KEY missing in .env")
-genai.configure(api_key=GEMINI_API_KEY)
-gemini_model = genai.GenerativeModel("models/gemini-1.5-pro-001")
-
-# === Pinecone config ===
-PINECONE_API_KEY = os.getenv("PINECONE_API_KEY")
-PINECONE_ENV     = os.getenv("PINECONE_ENVIRONMENT")
-PINECONE_CLOUD   = os.getenv("PINECONE_CLOUD")
-PINECONE_REGION  = os.getenv("PINECONE_REGION")
-INDEX_NAME       = "book-index"
-DIMENSION        = 768
-
-if not all([PINECONE_API_KEY, PINECONE_ENV, PINECONE_CLOUD, PINECONE_REGION]):
-    raise RuntimeError("One or more Pinecone vars missing in .env")
-
-# instantiate Pinecone client
-pc = Pinecone(
-    api_key=PINECONE_API_KEY,
-    environment=PINECONE_ENV
-)
 
-# create index if needed
-existing_indexes = pc.list_indexes().names()
-if INDEX_NAME not in existing_indexes:
-    pc.create_index(
-        name=INDEX_NAME,
-        vector_type="dense",
-        dimension=DIMENSION,
-        metric="cosine",
-        spec=ServerlessSpec(
-            cloud=PINECONE_CLOUD,
-            region=PINECONE_REGION
-        ),
-        deletion_protection="disabled"
-    )
+class RecordTimings:
+    # Request latency per route for /metrics; with TIMING_HEADERS the spans opened
+    # while serving the request are reported in a Server-Timing header. A plain
+    # ASGI middleware: `receive` reaches the endpoints untouched, so
+    # request.is_disconnected() (until_disconnected) sees clients going away.
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        started = time.perf_counter()
+        token = metrics.start_request() if TIMING_HEADERS else None
+        status_code = 500
+
+        async def send_timed(message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                if token is not None:
+                    stages = metrics.request_timing()
+                    total  = f"total;dur={(time.perf_counter() - started) * 1000:.1f}"
+                    MutableHeaders(scope=message).append("Server-Timing", f"{stages}, {total}" if stages else total)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_timed)
+        finally:
+            route = scope.get("route")
+            metrics.request_seconds.observe(time.perf_counter() - started, method=scope["method"],
+                                            route=getattr(route, "path", "unmatched"), status=str(status_code))
+            if token is not None:
+                metrics.finish_request(token)
+
+
+app.add_middleware(RecordTimings)
+
+
+@app.exception_handler(scheduler.Overloaded)
+async def overloaded(request: Request, exc: scheduler.Overloaded):
+    # a full Gemini queue: 429 with an estimate of when a slot should be free
+    logger.warning(f"Rejected {request.url.path}: {exc}")
+    return JSONResponse(status_code=429, content={"detail": str(exc)},
+                        headers={"Retry-After": str(exc.retry_after)})
 
-# get handle to index
-index = pc.Index(INDEX_NAME)
+# === Gemini config ===
+# only the key is checked at startup; the client is imported and configured on first use
+gemini.api_key()
 
 # === Helpers ===
 
-def extract_text_from_pdf(path: str) -> str:
-    doc = fitz.open(path)
-    return "\n".join(page.get_text() for page in doc)
-
-
-def chunk_text(text: str, chunk_size: int = 500) -> List[str]:
-    return [text[i : i + chunk_size] for i in range(0, len(text), chunk_size)]
-
-
-def get_embedding(text: str) -> np.ndarray:
-    resp = genai.embed_content(
-        model="models/embedding-001",
-        content=text,
-        task_type="retrieval_document",
-        title="book content"
-    )
+# Every Gemini call takes a slot from the shared scheduler (see scheduler.py):
+# questions as INTERACTIVE work of the asking user, batches as BULK.
+def get_embedding(text: str, user_id: str = "", priority: str = INTERACTIVE) -> np.ndarray:
+    with scheduler.get_scheduler().slot(user_id, priority), metrics.span("embed_query"):
+        resp = gemini.client().embed_content(
+            model="models/embedding-001",
+            content=text,
+            task_type="retrieval_document",
+            title="book content"
+        )
     return np.array(resp["embedding"])
 
 
-def book_already_indexed(user_id: str, book_name: str) -> bool:
-    res = index.query(
-        vector=[0.0] * DIMENSION,
-        top_k=1,
-        include_metadata=True,
-        filter={"user_id": user_id, "book_name": book_name}
-    )
-    return len(res.matches) > 0
+async def get_embedding_async(text: str, user_id: str = "") -> List[float]:
+    genai = await gemini.client_async()
+    async with scheduler.get_scheduler().aslot(user_id):
+        with metrics.span("embed_query"):
+            resp = await asyncio.wait_for(genai.embed_content_async(
+                model="models/embedding-001",
+                content=text,
+                task_type="retrieval_document",
+                title="book content"
+            ), gemini.EMBED_TIMEOUT)
+    return list(resp["embedding"])
 
 
-def ask_gemini(question: str, context: str) -> str:
-    prompt = (
+def build_prompt(question: str, context: str) -> str:
+    return (
         "You are a helpful assistant rewriting book excerpts in a clear, formal tone.\n\n"
         f"User's Question:\n{question}\n\n"
         f"Relevant Excerpt:\n{context}\n\n"
         "➡️ Rephrase to directly answer the user's question."
     )
-    return gemini_model.generate_content(prompt).text.strip()
+
+
+def ask_gemini(question: str, context: str, user_id: str = "", priority: str = INTERACTIVE) -> str:
+    with scheduler.get_scheduler().slot(user_id, priority), metrics.span("generate"):
+        return gemini.model().generate_content(build_prompt(question, context)).text.strip()
+
+
+async def ask_gemini_async(question: str, context: str, user_id: str = "") -> str:
+    model = await gemini.model_async()
+    async with scheduler.get_scheduler().aslot(user_id):
+        with metrics.span("generate"):
+            resp = await asyncio.wait_for(model.generate_content_async(build_prompt(question, context)),
+                                          gemini.GEMINI_TIMEOUT)
+    return resp.text.strip()
+
+
+async def stream_gemini(question: str, context: str) -> AsyncIterator[str]:
+    # GEMINI_TIMEOUT bounds the wait for the first token and every gap between tokens.
+    # The caller holds the scheduler slot for the length of the stream.
+    model = await gemini.model_async()
+    with metrics.span("generate_stream"):
+        stream = await asyncio.wait_for(model.generate_content_async(build_prompt(question, context), stream=True),
+                                        gemini.GEMINI_TIMEOUT)
+        parts = stream.__aiter__()
+        while True:
+            try:
+                part = await asyncio.wait_for(parts.__anext__(), gemini.GEMINI_TIMEOUT)
+            except StopAsyncIteration:
+                break
+            if part.text:
+                yield part.text
+
+
+T = TypeVar("T")
+
+
+async def in_retrieval_pool(fn, *args, **kwargs):
+    # runs a blocking call in retrieval_pool, keeping the request's context (metrics spans)
+    ctx = contextvars.copy_context()
+    return await asyncio.get_running_loop().run_in_executor(retrieval_pool, lambda: ctx.run(fn, *args, **kwargs))
+
+
+async def until_disconnected(request: Request, work: Awaitable[T]) -> T:
+    # Starlette doesn't cancel a handler whose client went away, so `work` runs as
+    # a task that is cancelled as soon as a disconnect is seen (answered with 499).
+    # Timeouts inside it become 504.
+    task = asyncio.ensure_future(work)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=DISCONNECT_POLL)
+            if done:
+                return task.result()
+            if await request.is_disconnected():
+                logger.info(f"Client disconnected, cancelled {request.url.path}")
+                raise HTTPException(status_code=499, detail="Client closed request.")
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail="Timed out waiting for an upstream service.")
+    finally:
+        task.cancel()
 
 # === Pydantic schemas ===
 
@@ -133,6 +233,13 @@ class AskRequest(BaseModel):
     user_id: str
     book_name: str
     query: str
+    mode: str = "auto"          # auto | hybrid | vector | lexical
+
+class BatchAskRequest(BaseModel):
+    user_id: str
+    book_name: str
+    queries: List[str]
+    mode: str = "auto"
 
 class AskResponse(BaseModel):
     answer: str
@@ -184,98 +291,327 @@ logger = logging.getLogger("uvicorn.error")
 #     except Exception as e:
 #         logger.error(f"Error in upload_book: {e}", exc_info=True)
 
-@app.post("/books/", response_model=dict)
+def store_upload(src) -> Tuple[str, str, int]:
+    # Streams an uploaded file to UPLOAD_DIR in UPLOAD_BLOCK_SIZE blocks while
+    # hashing it, then moves it to its content address; returns (sha256, path, size).
+    # Identical uploads end up at the same path whatever their filename.
+    os.makedirs(UPLOAD_DIR, exist_ok=True)
+    digest, size = hashlib.sha256(), 0
+    fd, tmp = tempfile.mkstemp(dir=UPLOAD_DIR, suffix=".part")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            for block in iter(lambda: src.read(UPLOAD_BLOCK_SIZE), b""):
+                digest.update(block)
+                f.write(block)
+                size += len(block)
+        path = os.path.join(UPLOAD_DIR, f"{digest.hexdigest()}.pdf")
+        os.replace(tmp, path)
+    except BaseException:
+        os.remove(tmp)
+        raise
+    return digest.hexdigest(), path, size
+
+
+def index_book(job: jobs.Job, path: str, content_hash: Optional[str] = None) -> None:
+    user_id, book_name = job.user_id, job.book_name
+    get_catalog().ensure_user(user_id, get_store())
+
+    # pages are parsed, chunked, embedded and upserted as a stream, so each stage
+    # starts on the first pages while later ones are still being extracted.
+    # Re-uploads of a known book only re-index the chunks that changed.
+    job.update(stage="extracting")
+    progress = lambda st: job.update(stage="embedding", chunks_embedded=st.done, chunks_total=st.total)
+    with metrics.span("ingest"):
+        result = ingest_book(get_store(), user_id, book_name, path, progress=progress,
+                             on_upsert=job.add_upserted, content_hash=content_hash, echo=False)
+
+    if result["status"] == "unchanged":
+        job.update(stage="skipped", message=f"✅ '{book_name}' already indexed for {user_id}.")
+        return
+    qa_cache.invalidate_book(user_id, book_name)
+    verb = {"updated": "Updated", "linked": "Linked"}.get(result["status"], "Indexed")
+    resumed = f", {result['resumed']} resumed from checkpoint" if result.get("resumed") else ""
+    job.update(stage="done", message=f"📚 {verb} '{book_name}' for {user_id} "
+                                     f"({result['upserted']} chunks upserted, {result['deleted']} deleted, "
+                                     f"{len(result['changed_pages'])} pages changed{resumed}).")
+    logger.info(job.message)
+
+
+@app.on_event("startup")
+def resume_ingestion() -> None:
+    # books whose ingestion was cut short by a crash or restart pick up from their checkpoint
+    if not RESUME_INGESTION:
+        return
+    for cp in get_catalog().list_checkpoints():
+        if not os.path.exists(cp["path"]):
+            logger.warning(f"Can't resume '{cp['book_name']}' for {cp['user_id']}: {cp['path']} is gone")
+            continue
+        job = jobs.submit(cp["user_id"], cp["book_name"],
+                          lambda job, cp=cp: index_book(job, cp["path"], cp["content_hash"]))
+        logger.info(f"Resuming ingestion of '{cp['book_name']}' for {cp['user_id']} as job {job.id}")
+
+
+@app.post("/books/", response_model=dict, status_code=status.HTTP_202_ACCEPTED)
 async def upload_book(file: UploadFile = File(...), user_id: str = Form(...)):
+    if jobs.pending(user_id) >= jobs.JOB_USER_LIMIT:
+        raise HTTPException(status_code=429, headers={"Retry-After": str(UPLOAD_RETRY_AFTER)},
+                            detail=f"Already indexing {jobs.JOB_USER_LIMIT} book(s) for this user; try again later.")
     try:
-        os.makedirs("uploads", exist_ok=True)
-        path = f"uploads/{file.filename}"
-        with open(path, "wb") as f:
-            f.write(await file.read())
-
-        if book_already_indexed(user_id, file.filename):
-            return {"status": f"✅ '{file.filename}' already indexed for {user_id}."}
-
-        text   = extract_text_from_pdf(path)
-        chunks = chunk_text(text, chunk_size=300)
-        vectors = []
-
-        for i, chunk in enumerate(chunks):
-            print(f"Embedding chunk {i+1}/{len(chunks)}")
-            emb = get_embedding(chunk)
-            vectors.append({
-                "id":       f"{user_id}-{file.filename}-chunk-{i}",
-                "values":   emb.tolist(),
-                "metadata": {
-                    "user_id": user_id,
-                    "book_name": file.filename,
-                    "text": chunk
-                }
-            })
-            time.sleep(0.3)
-
-        BATCH_SIZE = 50
-        for i in range(0, len(vectors), BATCH_SIZE):
-            batch = vectors[i:i+BATCH_SIZE]
-            index.upsert(vectors=batch)
-
-        return {"status": f"📚 Indexed '{file.filename}' for {user_id}."}
+        # never held in memory: Starlette spools the upload, which is copied in blocks off the event loop
+        digest, path, size = await asyncio.to_thread(store_upload, file.file)
+        logger.info(f"Stored upload '{file.filename}' ({size} bytes) as {path}")
+
+        job = jobs.submit(user_id, file.filename, lambda job: index_book(job, path, digest))
+        return {"status": f"⏳ Queued '{file.filename}' for indexing.", "job_id": job.id}
     except Exception as e:
         logger.error(f"Error in upload_book: {e}", exc_info=True)
-        raise HTTPException(status_code=500, detail="Error while indexing the book.")
-    
+        raise HTTPException(status_code=500, detail="Error while queueing the book.")
+
 
+@app.get("/jobs/{job_id}", response_model=dict)
+def get_job(job_id: str):
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"No job '{job_id}'.")
+    return job.to_dict()
 
 
 @app.get("/books/{user_id}", response_model=BooksResponse)
 def list_books(user_id: str):
-    res = index.query(
-        vector=[0.0] * DIMENSION,
-        top_k=100,
-        include_metadata=True,
-        filter={"user_id": user_id}
-    )
-    books = {m.metadata["book_name"] for m in res.matches}
-    return {"books": sorted(books)}
+    catalog = get_catalog()
+    catalog.ensure_user(user_id, get_store())
+    return {"books": catalog.list_books(user_id)}
 
 # Debug endpoint to list indexed chunks for a user and book
 from fastapi.responses import JSONResponse
 
 @app.get("/debug/indexed_chunks/{user_id}/{book_name}")
 def list_indexed_chunks(user_id: str, book_name: str):
-    res = index.query(
+    matches = get_store().query(
         vector=[0.0] * DIMENSION,
         top_k=100,
         include_metadata=True,
-        filter={"user_id": user_id, "book_name": book_name}
+        filter={"user_id": user_id, "book_name": book_name},
+        namespace=namespace_for(user_id, book_name)
     )
-    chunks = [{"id": m.id, "text": m.metadata.get("text", "")} for m in res.matches]
+    texts  = retrieval.chunk_texts(matches)
+    chunks = [{"id": m.id, "text": texts[m.id]} for m in matches]
     return JSONResponse(content={"chunks": chunks})
 
-@app.post("/questions/", response_model=AskResponse)
-def ask_question(req: AskRequest):
-    # semantic search
-    emb = get_embedding(req.query).tolist()
-    res = index.query(
-        vector=emb,
-        top_k=1,
-        include_metadata=True,
-        filter={"user_id": req.user_id, "book_name": req.book_name}
-    )
+def query_embedding(query: str, user_id: str = "", priority: str = INTERACTIVE) -> List[float]:
+    # query embeddings are cached by normalized text
+    norm = qa_cache.normalize_query(query)
+    emb = qa_cache.query_embeddings.get(norm)
+    if emb is None:
+        emb = get_embedding(query, user_id, priority).tolist()
+        qa_cache.query_embeddings.put(norm, emb)
+    return emb
+
+
+async def query_embedding_async(query: str, user_id: str = "") -> List[float]:
+    norm = qa_cache.normalize_query(query)
+    emb = qa_cache.query_embeddings.get(norm)
+    if emb is None:
+        emb = await get_embedding_async(query, user_id)
+        qa_cache.query_embeddings.put(norm, emb)
+    return emb
+
+
+async def retrieve(req: AskRequest) -> list:
+    # hybrid search: BM25 + dense hits fused with RRF (keyword lookups skip the embedding).
+    # The query is embedded on the event loop up front; the blocking search then
+    # runs in retrieval_pool, falling back to a sync embedding only for keyword
+    # queries that BM25 can't answer.
+    vector = None
+    if req.mode in ("hybrid", "vector") or (req.mode == "auto" and not retrieval.is_keyword(req.query)):
+        vector = await query_embedding_async(req.query, req.user_id)
+    embed = (lambda q: vector) if vector is not None else (lambda q: query_embedding(q, req.user_id))
+    try:
+        matches = await asyncio.wait_for(
+            in_retrieval_pool(retrieval.search, get_store(), req.user_id, req.book_name, req.query,
+                              embed=embed, mode=req.mode),
+            RETRIEVAL_TIMEOUT)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     # Log query details and number of matches found
     logger.info(f"ask_question called with user_id={req.user_id}, book_name={req.book_name}, query={req.query}")
-    logger.info(f"Number of matches found: {len(res.matches)}")
-    if not res.matches:
+    logger.info(f"Number of matches found: {len(matches)}")
+    if not matches:
         raise HTTPException(status_code=404, detail="No relevant content found.")
-    context = res.matches[0].metadata["text"]
-    answer  = ask_gemini(req.query, context)
-    return {"answer": answer}
+    return matches
+
+
+def answer_for(user_id: str, book_name: str, query: str, matches: list, priority: str = INTERACTIVE) -> str:
+    # answers are cached by user, book, retrieved chunk ids and normalized question
+    answer_key = (user_id, book_name, tuple(m.id for m in matches), qa_cache.normalize_query(query))
+    answer = qa_cache.answers.get(answer_key)
+    if answer is None:
+        context = retrieval.context_text(matches)
+        answer  = ask_gemini(query, context, user_id, priority)
+        qa_cache.answers.put(answer_key, answer)
+    return answer
+
+
+async def answer_for_async(user_id: str, book_name: str, query: str, matches: list) -> str:
+    # answer_for() with the Gemini call awaited; packed matches carry their text,
+    # so building the context does no I/O
+    answer_key = (user_id, book_name, tuple(m.id for m in matches), qa_cache.normalize_query(query))
+    answer = qa_cache.answers.get(answer_key)
+    if answer is None:
+        context = retrieval.context_text(matches)
+        answer  = await ask_gemini_async(query, context, user_id)
+        qa_cache.answers.put(answer_key, answer)
+    return answer
+
+
+@app.post("/questions/", response_model=AskResponse)
+async def ask_question(req: AskRequest, request: Request):
+    async def answer() -> dict:
+        matches = await retrieve(req)
+        return {"answer": await answer_for_async(req.user_id, req.book_name, req.query, matches)}
+    return await until_disconnected(request, answer())
+
+
+def sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@app.post("/questions/stream")
+async def ask_question_stream(req: AskRequest, request: Request):
+    # Same retrieval as /questions/, but the answer is sent as Server-Sent Events:
+    # `context` (retrieved chunk ids) first, then `token` events while Gemini
+    # generates, then `done` with timings (or `error`). Starlette stops the
+    # stream, cancelling generation, when the client disconnects. The Gemini slot
+    # is taken before the response starts, so a full queue is still a plain 429.
+    started = time.perf_counter()
+    norm    = qa_cache.normalize_query(req.query)
+    matches = await until_disconnected(request, retrieve(req))
+    ids     = [m.id for m in matches]
+    answer_key = (req.user_id, req.book_name, tuple(ids), norm)
+    cached  = qa_cache.answers.get(answer_key)
+    lease   = None
+    if cached is None:
+        lease = await until_disconnected(request, scheduler.get_scheduler().acquire_async(req.user_id))
+
+    async def cached_tokens(answer: str) -> AsyncIterator[str]:
+        yield answer
+
+    async def events() -> AsyncIterator[str]:
+        parts, ttft = [], None
+        try:
+            yield sse("context", {"chunk_ids": ids})
+            tokens = cached_tokens(cached) if cached is not None else stream_gemini(req.query, retrieval.context_text(matches))
+            async for text in tokens:
+                if ttft is None:
+                    ttft = time.perf_counter() - started
+                parts.append(text)
+                yield sse("token", {"text": text})
+        except asyncio.TimeoutError:
+            logger.error("Timed out in ask_question_stream waiting for Gemini")
+            yield sse("error", {"detail": "Timed out waiting for the answer."})
+            return
+        except Exception as e:
+            logger.error(f"Error in ask_question_stream: {e}", exc_info=True)
+            yield sse("error", {"detail": "Error while generating the answer."})
+            return
+        finally:
+            if lease is not None:
+                lease.release()
+        total = time.perf_counter() - started
+        if cached is None:
+            qa_cache.answers.put(answer_key, "".join(parts).strip())
+        ttft_ms, total_ms = round((ttft or total) * 1000, 1), round(total * 1000, 1)
+        logger.info(f"ask_question_stream user_id={req.user_id} book_name={req.book_name} "
+                    f"ttft={ttft_ms}ms total={total_ms}ms cached={cached is not None}")
+        yield sse("done", {"ttft_ms": ttft_ms, "total_ms": total_ms, "cached": cached is not None})
+
+    # the background task frees the slot should the stream never start
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+                             background=BackgroundTask(lease.release) if lease is not None else None)
+
+
+@app.post("/questions/batch")
+def ask_questions_batch(req: BatchAskRequest):
+    # Answers many questions about one book as NDJSON, one line per question in
+    # request order, each streamed as soon as it and all earlier ones are done.
+    # Query embeddings are batched, retrievals run concurrently and generations
+    # go through a bounded pool (see batch_qa). Its Gemini calls are BULK work,
+    # so they queue behind the user's and everyone else's interactive questions.
+    if req.mode not in retrieval.MODES:
+        raise HTTPException(status_code=400, detail=f"Unknown retrieval mode '{req.mode}'")
+    if not req.queries:
+        raise HTTPException(status_code=400, detail="No queries given.")
+    if len(req.queries) > batch_qa.BATCH_MAX_QUESTIONS:
+        raise HTTPException(status_code=413, detail=f"At most {batch_qa.BATCH_MAX_QUESTIONS} queries per batch.")
+    logger.info(f"ask_questions_batch user_id={req.user_id} book_name={req.book_name} queries={len(req.queries)}")
+
+    results = batch_qa.answer_batch(
+        get_store(), req.user_id, req.book_name, req.queries,
+        generate=lambda query, matches: answer_for(req.user_id, req.book_name, query, matches, BULK),
+        embed=lambda query: query_embedding(query, req.user_id, BULK), mode=req.mode,
+    )
+
+    def lines() -> Iterator[str]:
+        try:
+            for result in results:
+                yield json.dumps(result) + "\n"
+        finally:
+            results.close()                     # client went away: cancel what hasn't started
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def prometheus_metrics():
+    # Prometheus text format: bookbot_stage_seconds{stage, outcome},
+    # bookbot_items_total{kind}, bookbot_http_request_seconds{method, route, status}
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
+HEALTH_TTL   = float(os.getenv("HEALTH_TTL", "30"))      # seconds a health check result is reused
+health_cache = qa_cache.TTLCache(maxsize=1, ttl=HEALTH_TTL)
+
+
+def check(probe) -> str:
+    try:
+        probe()
+        return "ok"
+    except Exception as e:
+        return f"error: {e}"
+
+
+@app.get("/health")
+def health():
+    # The first call connects to the vector store (verifying the index) and
+    # configures Gemini; results are cached so probes don't hit Pinecone each time
+    result = health_cache.get("health")
+    if result is None:
+        result = {"vector_store": check(lambda: get_store().ping()), "gemini": check(gemini.client)}
+        health_cache.put("health", result)
+    ok = all(v == "ok" for v in result.values())
+    return JSONResponse(status_code=200 if ok else 503, content={"status": "ok" if ok else "degraded", **result})
+
+
+@app.get("/debug/cache")
+def cache_stats():
+    return {
+        "query_embeddings": qa_cache.query_embeddings.stats(),
+        "answers":          qa_cache.answers.stats(),
+        "gemini_scheduler": scheduler.get_scheduler().stats(),
+    }
 
 from fastapi import status, HTTPException, Form
 
 @app.post("/books/delete", status_code=status.HTTP_200_OK)
 def delete_book(user_id: str = Form(...), book_name: str = Form(...)):
-    success = delete_chunks(user_id, book_name)
-    if success:
-        return {"status": f"✅ Deleted all chunks for book '{book_name}' and user '{user_id}'."}
+    deleted, seconds = delete_chunks(user_id, book_name)
+    qa_cache.invalidate_book(user_id, book_name)
+    if deleted:
+        return {
+            "status":  f"✅ Deleted all chunks for book '{book_name}' and user '{user_id}'.",
+            "deleted": deleted,
+            "seconds": round(seconds, 3),
+        }
     else:
         raise HTTPException(status_code=404, detail=f"No chunks found for book '{book_name}' and user '{user_id}'.")
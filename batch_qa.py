@@ -0,0 +1,129 @@
+import os
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, Iterator, List, Tuple
+
+import metrics
+import qa_cache
+import retrieval
+from ingest import EMBED_BATCH_SIZE, embed_batch
+from vector_store import Match, VectorStore
+
+# === Batch question answering ===
+# Shared by POST /questions/batch and `main.py --questions-file`: all query
+# embeddings are computed up front in multi-content calls, retrievals run
+# concurrently, and each question's generation is dispatched to a bounded pool
+# as soon as its context is ready. Results come back in question order.
+BATCH_MAX_QUESTIONS      = int(os.getenv("BATCH_MAX_QUESTIONS", "1000"))
+BATCH_RETRIEVAL_WORKERS  = int(os.getenv("BATCH_RETRIEVAL_WORKERS", "8"))
+BATCH_GENERATION_WORKERS = int(os.getenv("BATCH_GENERATION_WORKERS", "4"))
+
+
+def embed_queries(queries: List[str], user_id: str = "") -> Tuple[Dict[str, List[float]], Dict[str, float],
+                                                                  Dict[str, str]]:
+    # (normalized query -> embedding, normalized query -> ms of the call that embedded it,
+    # normalized query -> error of the call that failed to); cached queries cost 0 ms.
+    # The calls are queued as bulk work of `user_id`.
+    embeddings: Dict[str, List[float]] = {}
+    failed: Dict[str, str] = {}
+    todo: List[str] = []
+    for norm in dict.fromkeys(qa_cache.normalize_query(q) for q in queries):
+        emb = qa_cache.query_embeddings.get(norm)
+        if emb is None:
+            todo.append(norm)
+        else:
+            embeddings[norm] = emb
+    spent = {norm: 0.0 for norm in embeddings}
+    for i in range(0, len(todo), EMBED_BATCH_SIZE):
+        part = todo[i:i + EMBED_BATCH_SIZE]
+        t0 = time.perf_counter()
+        try:
+            with metrics.span("embed_query"):
+                embs = embed_batch(part, user_id=user_id)
+        except Exception as e:
+            failed.update((norm, str(e)) for norm in part)
+            continue
+        ms = (time.perf_counter() - t0) * 1000
+        for norm, emb in zip(part, embs):
+            embeddings[norm] = emb.tolist()
+            spent[norm] = ms
+            qa_cache.query_embeddings.put(norm, embeddings[norm])
+    return embeddings, spent, failed
+
+
+def answer_batch(
+    store: VectorStore,
+    user_id: str,
+    book_name: str,
+    queries: List[str],
+    generate: Callable[[str, List[Match]], str],
+    embed: Callable[[str], List[float]],
+    mode: str = "auto",
+    retrieval_workers: int = BATCH_RETRIEVAL_WORKERS,
+    generation_workers: int = BATCH_GENERATION_WORKERS,
+) -> Iterator[dict]:
+    # Yields one result per query, in order:
+    #   {"index", "query", "answer" or "error", "chunk_ids", "timings": {embed_ms, retrieve_ms, generate_ms, total_ms}}
+    # `generate(query, matches)` produces the answer; `embed` is only a fallback for
+    # keyword queries whose BM25 lookup comes back empty. Both should queue their
+    # Gemini calls as scheduler.BULK work, like the embeddings made here. Closing the iterator
+    # early cancels every question not yet started.
+    started = time.perf_counter()
+    dense = [q for q in queries if mode != "lexical" and not (mode == "auto" and retrieval.is_keyword(q))]
+    embeddings, embed_ms, embed_errors = embed_queries(dense, user_id)
+
+    def query_embedding(query: str) -> List[float]:
+        emb = embeddings.get(qa_cache.normalize_query(query))
+        return emb if emb is not None else embed(query)
+
+    results: List[Future] = [Future() for _ in queries]
+    retrieve_pool = ThreadPoolExecutor(max_workers=retrieval_workers, thread_name_prefix="batch-retrieve")
+    generate_pool = ThreadPoolExecutor(max_workers=generation_workers, thread_name_prefix="batch-generate")
+
+    def finish(n: int, result: dict) -> None:
+        result["timings"]["total_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        results[n].set_result(result)
+
+    def run_generate(n: int, result: dict, matches: List[Match]) -> None:
+        t0 = time.perf_counter()
+        try:
+            result["answer"] = generate(result["query"], matches)
+        except Exception as e:
+            result["error"] = f"Generation failed: {e}"
+        result["timings"]["generate_ms"] = round((time.perf_counter() - t0) * 1000, 1)
+        finish(n, result)
+
+    def run_retrieve(n: int, query: str) -> None:
+        norm = qa_cache.normalize_query(query)
+        result = {"index": n, "query": query, "chunk_ids": [],
+                  "timings": {"embed_ms": round(embed_ms.get(norm, 0.0), 1)}}
+        if norm in embed_errors:
+            result["error"] = f"Embedding failed: {embed_errors[norm]}"
+            result["timings"]["retrieve_ms"] = 0.0
+            finish(n, result)
+            return
+        t0 = time.perf_counter()
+        try:
+            matches = retrieval.search(store, user_id, book_name, query, embed=query_embedding, mode=mode)
+        except Exception as e:
+            matches, result["error"] = [], f"Retrieval failed: {e}"
+        result["timings"]["retrieve_ms"] = round((time.perf_counter() - t0) * 1000, 1)
+        result["chunk_ids"] = [m.id for m in matches]
+        if not matches:
+            result.setdefault("error", "No relevant content found.")
+            finish(n, result)
+            return
+        # hand off to the generation pool so retrieval workers never wait on Gemini
+        try:
+            generate_pool.submit(run_generate, n, result, matches)
+        except RuntimeError:                    # pool shut down: the batch was abandoned
+            results[n].cancel()
+
+    try:
+        for n, query in enumerate(queries):
+            retrieve_pool.submit(run_retrieve, n, query)
+        for fut in results:
+            yield fut.result()
+    finally:
+        retrieve_pool.shutdown(wait=False, cancel_futures=True)
+        generate_pool.shutdown(wait=False, cancel_futures=True)
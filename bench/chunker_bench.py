@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+# Chunking throughput on the sample PDFs: python bench/chunker_bench.py [pdf ...]
+import os
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from chunker import CHUNK_OVERLAP, CHUNK_TOKENS, iter_chunks
+from pdf_extract import iter_pages
+
+ROOT    = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SAMPLES = [os.path.join(ROOT, name) for name in ("book.pdf", "book2.pdf", "book3.pdf")]
+
+
+def bench(path: str, repeat: int, max_tokens: int, overlap: int) -> None:
+    pages = list(iter_pages(path))                        # extraction is not timed
+    size  = sum(len(t.encode("utf-8")) for _, t in pages) / 1e6
+
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        chunks = list(iter_chunks(pages, max_tokens, overlap))
+        best = min(best, time.perf_counter() - t0)
+
+    text  = "\n".join(t for _, t in pages)
+    t0    = time.perf_counter()
+    fixed = [text[i:i + 300] for i in range(0, len(text), 300)]
+    naive = time.perf_counter() - t0
+
+    avg = sum(len(c.text) for c in chunks) / max(1, len(chunks))
+    print(f"{os.path.basename(path):<12} {len(pages):>5} pages {size:7.2f} MB  "
+          f"{len(chunks):>6} chunks (avg {avg:.0f} chars, {len(fixed)} fixed-300)  "
+          f"{size / best:8.1f} MB/s  (fixed-300 slicing: {size / naive:.0f} MB/s)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark chunker.iter_chunks")
+    parser.add_argument("pdfs", nargs="*", default=SAMPLES)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--max-tokens", type=int, default=CHUNK_TOKENS)
+    parser.add_argument("--overlap", type=int, default=CHUNK_OVERLAP)
+    args = parser.parse_args()
+    for pdf in args.pdfs:
+        bench(pdf, args.repeat, args.max_tokens, args.overlap)
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+# Client disconnect check: python bench/disconnect_check.py [--generate-latency 3.0]
+# Serves api.py with uvicorn (the real middleware stack) against the offline
+# stand-ins of bench/fakes.py, asks questions whose answers take
+# --generate-latency seconds and drops each connection early. Checks that the
+# Gemini slot is given back well before generation would have finished, i.e.
+# that the disconnect cancelled the work. Exits non-zero on failure, so it can
+# gate CI.
+import os
+import sys
+import time
+import socket
+import argparse
+import tempfile
+import threading
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+SAMPLE  = os.path.join(ROOT, "book.pdf")
+USER_ID = "bench@example.com"
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def released_within(seconds: float) -> bool:
+    # true once no interactive Gemini call holds a slot
+    import scheduler
+
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        if scheduler.get_scheduler().stats()["running"]["interactive"] == 0:
+            return True
+        time.sleep(0.05)
+    return False
+
+
+def ask(url: str, path: str, query: str, give_up: float) -> None:
+    # sends the question and closes the connection after `give_up` seconds
+    import httpx
+
+    body = {"user_id": USER_ID, "book_name": os.path.basename(SAMPLE), "query": query}
+    try:
+        with httpx.Client(base_url=url, timeout=give_up) as client:
+            with client.stream("POST", path, json=body) as resp:
+                started = time.monotonic()
+                for _ in resp.iter_bytes():
+                    if time.monotonic() - started > give_up:
+                        break
+    except httpx.TimeoutException:
+        pass
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check that api.py cancels work when the client disconnects")
+    parser.add_argument("--generate-latency", type=float, default=3.0, help="seconds per fake answer")
+    parser.add_argument("--give-up", type=float, default=0.5, help="seconds before the client disconnects")
+    args = parser.parse_args()
+
+    os.chdir(tempfile.mkdtemp(prefix="disconnect-check-"))
+    os.environ.setdefault("GEMINI_API_KEY", "bench")
+    os.environ.setdefault("EMBED_RATE", "1000")
+    sys.path.insert(0, os.path.join(ROOT, "bench"))
+    import fakes
+
+    store = fakes.install(fakes.Timings(), generate_latency=args.generate_latency)
+    import uvicorn
+    import api
+    from ingest import ingest_book
+
+    ingest_book(store, USER_ID, os.path.basename(SAMPLE), SAMPLE, echo=False)
+    port   = free_port()
+    server = uvicorn.Server(uvicorn.Config(api.app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+
+    failed = False
+    for path in ("/questions/", "/questions/stream"):
+        t0 = time.monotonic()
+        ask(f"http://127.0.0.1:{port}", path, f"what does the author say about chapter one ({path})", args.give_up)
+        ok = released_within(args.generate_latency / 2)
+        print(f"{'ok  ' if ok else 'FAIL'} {path:20} slot released {time.monotonic() - t0:.2f}s after the request "
+              f"(generation takes {args.generate_latency:.1f}s)")
+        failed |= not ok
+
+    server.should_exit = True
+    sys.exit(1 if failed else 0)
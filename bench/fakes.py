@@ -0,0 +1,266 @@
+# Offline stand-ins for Gemini and the vector index, used by bench/pipeline_bench.py.
+# Installed with install() before the first Gemini or vector store call, so the real
+# code paths (ingest, retrieval, jobs, caches) run unchanged against them.
+import time
+import asyncio
+import hashlib
+import threading
+from typing import AsyncIterator, Dict, Iterator, List, Optional
+
+import numpy as np
+
+from vector_store import DIMENSION, Match, VectorStore
+
+
+class Timings:
+    # seconds per call, grouped by stage
+    def __init__(self):
+        self.samples: Dict[str, List[float]] = {}
+        self.lock = threading.Lock()
+
+    def add(self, stage: str, seconds: float) -> None:
+        with self.lock:
+            self.samples.setdefault(stage, []).append(seconds)
+
+    def timed(self, stage: str, fn, *args, **kwargs):
+        t0 = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            self.add(stage, time.perf_counter() - t0)
+
+    def summary(self) -> Dict[str, dict]:
+        with self.lock:
+            samples = {k: list(v) for k, v in self.samples.items()}
+        out = {}
+        for stage, values in sorted(samples.items()):
+            ms = np.asarray(values) * 1000
+            p50, p95, p99 = np.percentile(ms, [50, 95, 99])
+            out[stage] = {"count": len(ms), "total_ms": round(float(ms.sum()), 3),
+                          "mean_ms": round(float(ms.mean()), 3), "p50_ms": round(float(p50), 3),
+                          "p95_ms": round(float(p95), 3), "p99_ms": round(float(p99), 3)}
+        return out
+
+
+def fake_embedding(text: str) -> List[float]:
+    # deterministic unit vector seeded by the text, so identical text embeds identically
+    seed = int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "little")
+    vec  = np.random.default_rng(seed).standard_normal(DIMENSION).astype(np.float32)
+    return (vec / np.linalg.norm(vec)).tolist()
+
+
+class FakeEmbedder:
+    # stands in for genai.embed_content: one content or a list of contents per call
+    def __init__(self, timings: Timings, latency: float = 0.0):
+        self.timings = timings
+        self.latency = latency
+
+    def __call__(self, model: str, content, task_type: str = "retrieval_document", title=None, **kwargs):
+        t0 = time.perf_counter()
+        if self.latency:
+            time.sleep(self.latency)
+        if isinstance(content, str):
+            resp = {"embedding": fake_embedding(content)}
+            self.timings.add("embed_query", time.perf_counter() - t0)
+        else:
+            resp = {"embedding": [fake_embedding(c) for c in content]}
+            self.timings.add("embed_batch", time.perf_counter() - t0)
+        return resp
+
+    async def embed_async(self, model: str, content, task_type: str = "retrieval_document", title=None, **kwargs):
+        # genai.embed_content_async: same response, latency awaited instead of slept
+        t0 = time.perf_counter()
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        resp = {"embedding": fake_embedding(content)}
+        self.timings.add("embed_query", time.perf_counter() - t0)
+        return resp
+
+
+class _Text:
+    def __init__(self, text: str):
+        self.text = text
+
+
+class FakeModel:
+    # stands in for genai.GenerativeModel: echoes the start of the prompt's excerpt
+    # after `latency` seconds, spread over the parts when streaming
+    timings: Optional[Timings] = None
+    latency = 0.0
+    words   = 60
+
+    def __init__(self, model_name: str = "", **kwargs):
+        self.model_name = model_name
+
+    def _answer(self, prompt: str) -> List[str]:
+        words = prompt.split()[-self.words:]
+        return [w + " " for w in words] or ["…"]
+
+    def generate_content(self, prompt: str, stream: bool = False, **kwargs):
+        if stream:
+            return self._stream(prompt)
+        t0 = time.perf_counter()
+        time.sleep(self.latency)
+        answer = _Text("".join(self._answer(prompt)))
+        self.timings.add("generate", time.perf_counter() - t0)
+        return answer
+
+    def _stream(self, prompt: str) -> Iterator[_Text]:
+        t0 = time.perf_counter()
+        parts = self._answer(prompt)
+        for part in parts:
+            time.sleep(self.latency / len(parts))
+            yield _Text(part)
+        self.timings.add("generate", time.perf_counter() - t0)
+
+    async def generate_content_async(self, prompt: str, stream: bool = False, **kwargs):
+        if stream:
+            return self._stream_async(prompt)
+        t0 = time.perf_counter()
+        await asyncio.sleep(self.latency)
+        answer = _Text("".join(self._answer(prompt)))
+        self.timings.add("generate", time.perf_counter() - t0)
+        return answer
+
+    async def _stream_async(self, prompt: str) -> AsyncIterator[_Text]:
+        t0 = time.perf_counter()
+        parts = self._answer(prompt)
+        for part in parts:
+            await asyncio.sleep(self.latency / len(parts))
+            yield _Text(part)
+        self.timings.add("generate", time.perf_counter() - t0)
+
+
+class MemoryStore(VectorStore):
+    # In-process vector index with Pinecone's query semantics (namespaces, cosine,
+    # metadata equality filters). Vectors are grouped per (namespace, user, book)
+    # and stacked into a matrix lazily, so queries cost one matmul over the books
+    # they can match.
+    def __init__(self, timings: Timings, latency: float = 0.0):
+        self.timings = timings
+        self.latency = latency
+        self.vectors: Dict[tuple, tuple] = {}           # (namespace, id) -> (unit vector, metadata)
+        self.groups: Dict[tuple, Dict[str, None]] = {}  # (namespace, user, book) -> ids, insertion ordered
+        self.stacked: Dict[tuple, tuple] = {}
+        self.lock = threading.Lock()
+
+    def _wait(self) -> None:
+        if self.latency:
+            time.sleep(self.latency)
+
+    def upsert(self, vectors: List[dict], namespace: str = "") -> None:
+        t0 = time.perf_counter()
+        self._wait()
+        with self.lock:
+            for v in vectors:
+                vec = np.asarray(v["values"], dtype=np.float32)
+                norm = np.linalg.norm(vec)
+                md = v.get("metadata", {})
+                key = (namespace, md.get("user_id"), md.get("book_name"))
+                self._drop(namespace, v["id"])
+                self.vectors[(namespace, v["id"])] = (vec / norm if norm else vec, md)
+                self.groups.setdefault(key, {})[v["id"]] = None
+                self.stacked.pop(key, None)
+        self.timings.add("upsert", time.perf_counter() - t0)
+
+    def _drop(self, namespace: str, id_: str) -> bool:
+        old = self.vectors.pop((namespace, id_), None)
+        if old is None:
+            return False
+        key = (namespace, old[1].get("user_id"), old[1].get("book_name"))
+        self.groups.get(key, {}).pop(id_, None)
+        self.stacked.pop(key, None)
+        return True
+
+    def _matrix(self, key: tuple):
+        if key not in self.stacked:
+            ids = list(self.groups.get(key, {}))
+            mat = np.stack([self.vectors[(key[0], i)][0] for i in ids]) if ids else np.zeros((0, DIMENSION), np.float32)
+            self.stacked[key] = (ids, mat)
+        return self.stacked[key]
+
+    def query(self, vector, top_k, filter, include_metadata=True, include_values=False, namespace=""):
+        t0 = time.perf_counter()
+        self._wait()
+        q = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(q)
+        q = q / norm if norm else q
+        hits = []
+        with self.lock:
+            keys = [k for k in self.groups if k[0] == namespace
+                    and all(filter.get(f) in (None, v) for f, v in zip(("user_id", "book_name"), k[1:]))]
+            for key in keys:
+                ids, mat = self._matrix(key)
+                if not ids:
+                    continue
+                scores, found = mat @ q, 0
+                for i in np.argsort(-scores):
+                    md = self.vectors[(namespace, ids[i])][1]
+                    if all(md.get(f) == v for f, v in filter.items()):
+                        hits.append((float(scores[i]), ids[i]))
+                        found += 1
+                        if found == top_k:
+                            break
+            hits.sort(key=lambda h: -h[0])
+            matches = [
+                Match(id_, score, dict(self.vectors[(namespace, id_)][1]) if include_metadata else None,
+                      self.vectors[(namespace, id_)][0].tolist() if include_values else None)
+                for score, id_ in hits[:top_k]
+            ]
+        self.timings.add("vector_query", time.perf_counter() - t0)
+        return matches
+
+    def delete(self, ids: List[str], namespace: str = "") -> int:
+        self._wait()
+        with self.lock:
+            return sum(self._drop(namespace, id_) for id_ in ids)
+
+    def delete_namespace(self, namespace: str) -> bool:
+        if not namespace:
+            return False
+        with self.lock:
+            for ns, id_ in [k for k in self.vectors if k[0] == namespace]:
+                self._drop(ns, id_)
+        return True
+
+    def delete_batched(self, ids, batch_size=None, workers=None, namespace=""):
+        return self.delete(ids, namespace=namespace)
+
+    def list_ids(self, prefix: str = "", namespace: str = ""):
+        with self.lock:
+            page = [id_ for ns, id_ in self.vectors if ns == namespace and id_.startswith(prefix)]
+        for i in range(0, len(page), 100):
+            yield page[i:i + 100]
+
+    def fetch(self, ids, include_values=False, namespace=""):
+        t0 = time.perf_counter()
+        self._wait()
+        with self.lock:
+            found = {
+                id_: Match(id_, 0.0, dict(self.vectors[(namespace, id_)][1]),
+                           self.vectors[(namespace, id_)][0].tolist() if include_values else None)
+                for id_ in ids if (namespace, id_) in self.vectors
+            }
+        self.timings.add("vector_fetch", time.perf_counter() - t0)
+        return found
+
+
+def install(timings: Timings, embed_latency: float = 0.0, generate_latency: float = 0.0,
+            store_latency: float = 0.0) -> MemoryStore:
+    # Swaps the Gemini SDK entry points and the vector store singleton. Must run
+    # before the first gemini.model() call, which caches a GenerativeModel built
+    # from the SDK, and before anything reaches get_store(). Importing api.py or
+    # main.py first is fine: neither touches Gemini until a request or command needs it.
+    import google.generativeai as genai
+    import vector_store
+
+    FakeModel.timings = timings
+    FakeModel.latency = generate_latency
+    genai.configure           = lambda **kwargs: None
+    embedder = FakeEmbedder(timings, embed_latency)
+    genai.embed_content       = embedder
+    genai.embed_content_async = embedder.embed_async
+    genai.GenerativeModel     = FakeModel
+    store = MemoryStore(timings, store_latency)
+    vector_store._store = store
+    return store
@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+# End-to-end ingestion and question benchmark against offline stand-ins:
+#   python bench/pipeline_bench.py [pdf ...] [--out results.json] [--baseline old.json]
+# Each (entry point, pdf) pair runs in a fresh process and working directory with
+# a fake embedder, a fake generator and an in-memory vector store (bench/fakes.py):
+#   api  uploads the PDF through POST /books/, polls /jobs/ and asks POST /questions/
+#   cli  runs main.py as a script, feeding the questions to its input() loop
+# Results (chunks/sec, peak RSS, p50/p95/p99 per stage) are written as JSON.
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import resource
+import builtins
+import tempfile
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+SAMPLES = [os.path.join(ROOT, name) for name in ("book.pdf", "book3.pdf")]
+USER_ID = "bench@example.com"
+
+
+def timed_iter(timings, stage: str, it):
+    # records the time spent producing each item
+    it = iter(it)
+    while True:
+        t0 = time.perf_counter()
+        try:
+            item = next(it)
+        except StopIteration:
+            return
+        timings.add(stage, time.perf_counter() - t0)
+        yield item
+
+
+def make_questions(chunks: list, n: int, seed: int) -> list:
+    # alternates short keyword lookups and longer phrase questions taken from the book
+    rng, questions = random.Random(seed), []
+    for k in range(n):
+        words = rng.choice(chunks).text.split()
+        size  = 2 if k % 2 else min(len(words), rng.randint(6, 12))
+        start = rng.randint(0, max(0, len(words) - size))
+        questions.append(" ".join(words[start:start + size]))
+    return questions
+
+
+def run_api(pdf: str, questions: list, timings) -> float:
+    from fastapi.testclient import TestClient
+    import api
+
+    client = TestClient(api.app)
+    t0 = time.perf_counter()
+    with open(pdf, "rb") as f:
+        resp = client.post("/books/", files={"file": (os.path.basename(pdf), f, "application/pdf")},
+                           data={"user_id": USER_ID})
+    resp.raise_for_status()
+    job_id = resp.json()["job_id"]
+    while True:
+        job = client.get(f"/jobs/{job_id}").json()
+        if job["stage"] in ("done", "skipped", "failed"):
+            break
+        time.sleep(0.01)
+    if job["stage"] == "failed":
+        raise RuntimeError(f"ingestion failed: {job['error']}")
+    ingest_seconds = time.perf_counter() - t0
+
+    for q in questions:
+        t0 = time.perf_counter()
+        resp = client.post("/questions/", json={"user_id": USER_ID, "book_name": os.path.basename(pdf), "query": q})
+        timings.add("question", time.perf_counter() - t0)
+        if resp.status_code not in (200, 404):
+            resp.raise_for_status()
+    return ingest_seconds
+
+
+def run_cli(pdf: str, questions: list, timings) -> float:
+    import runpy
+
+    # main.py indexes at import time and then reads questions from input(); the
+    # time until the first prompt is ingestion, and each prompt after a question
+    # ends that question
+    pending, marks = list(questions) + ["exit"], {}
+
+    def feed(prompt: str = "") -> str:
+        now = time.perf_counter()
+        if "ingested" not in marks:
+            marks["ingested"] = now
+        else:
+            timings.add("question", now - marks["asked"])
+        marks["asked"] = time.perf_counter()
+        return pending.pop(0)
+
+    sys.argv = [os.path.join(ROOT, "main.py"), pdf, USER_ID]
+    builtins.input = feed
+    t0 = time.perf_counter()
+    runpy.run_path(sys.argv[0], run_name="__main__")
+    return marks["ingested"] - t0
+
+
+def child(args) -> None:
+    import fakes
+
+    timings = fakes.Timings()
+    fakes.install(timings, args.embed_latency / 1000, args.generate_latency / 1000, args.store_latency / 1000)
+
+    from catalog import get_catalog
+    from chunker import iter_chunks
+    from pdf_extract import iter_pages
+
+    # extraction and chunking overlap inside the pipeline, so they are timed on their own first
+    pages  = list(timed_iter(timings, "extract_page", iter_pages(args.run_pdf)))
+    chunks = list(timed_iter(timings, "chunk", iter_chunks(pages)))
+    questions = make_questions(chunks, args.questions, args.seed)
+
+    runner = run_api if args.run == "api" else run_cli
+    ingest_seconds = runner(args.run_pdf, questions, timings)
+    book = get_catalog().get_book(USER_ID, os.path.basename(args.run_pdf))
+    n = book["chunk_count"] if book else 0
+
+    result = {
+        "entry_point":     args.run,
+        "pdf":             os.path.basename(args.run_pdf),
+        "pages":           len(pages),
+        "chunks":          n,
+        "questions":       len(questions),
+        "ingest_seconds":  round(ingest_seconds, 3),
+        "chunks_per_sec":  round(n / ingest_seconds, 1) if ingest_seconds else 0.0,
+        "peak_rss_mb":     round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "stages":          timings.summary(),
+    }
+    with open(args.result, "w", encoding="utf-8") as f:
+        json.dump(result, f)
+
+
+def commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def spawn(entry_point: str, pdf: str, args) -> dict:
+    with tempfile.TemporaryDirectory(prefix="pipeline-bench-") as work:
+        result = os.path.join(work, "result.json")
+        env = dict(os.environ, GEMINI_API_KEY="bench", VECTOR_STORE="local", EMBED_RATE="1000000",
+                   PYTHONPATH=os.pathsep.join([ROOT, os.path.dirname(os.path.abspath(__file__))]))
+        cmd = [sys.executable, os.path.abspath(__file__), "--run", entry_point, "--run-pdf", os.path.abspath(pdf),
+               "--result", result, "--questions", str(args.questions), "--seed", str(args.seed),
+               "--embed-latency", str(args.embed_latency), "--generate-latency", str(args.generate_latency),
+               "--store-latency", str(args.store_latency)]
+        proc = subprocess.run(cmd, cwd=work, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+        if proc.returncode:
+            raise RuntimeError(f"{entry_point} {os.path.basename(pdf)} failed:\n{proc.stderr[-4000:]}")
+        with open(result, encoding="utf-8") as f:
+            return json.load(f)
+
+
+def report(run: dict, baseline: dict = None) -> None:
+    def delta(new: float, old: float) -> str:
+        return f" ({(new - old) / old * 100:+.0f}%)" if old else ""
+
+    old = baseline or {}
+    print(f"{run['entry_point']:<4} {run['pdf']:<10} {run['pages']:>5} pages {run['chunks']:>6} chunks  "
+          f"{run['chunks_per_sec']:8.1f} chunks/sec{delta(run['chunks_per_sec'], old.get('chunks_per_sec', 0))}  "
+          f"peak RSS {run['peak_rss_mb']:.0f} MB{delta(run['peak_rss_mb'], old.get('peak_rss_mb', 0))}")
+    for stage, s in run["stages"].items():
+        was = old.get("stages", {}).get(stage, {})
+        print(f"    {stage:<14} n={s['count']:<6} p50 {s['p50_ms']:9.3f} ms  p95 {s['p95_ms']:9.3f} ms"
+              f"{delta(s['p95_ms'], was.get('p95_ms', 0))}  p99 {s['p99_ms']:9.3f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark ingestion and questions through api.py and main.py")
+    parser.add_argument("pdfs", nargs="*", default=SAMPLES)
+    parser.add_argument("--entry-points", nargs="+", default=["api", "cli"], choices=["api", "cli"])
+    parser.add_argument("--questions", type=int, default=50, help="questions asked per run")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--embed-latency", type=float, default=0.0, help="ms per fake embedding call")
+    parser.add_argument("--generate-latency", type=float, default=50.0, help="ms per fake generation")
+    parser.add_argument("--store-latency", type=float, default=0.0, help="ms per fake vector store call")
+    parser.add_argument("--out", help="JSON results file (default .cache/bench/pipeline-<commit>.json)")
+    parser.add_argument("--baseline", help="earlier results file to compare against")
+    parser.add_argument("--run", choices=["api", "cli"], help=argparse.SUPPRESS)
+    parser.add_argument("--run-pdf", help=argparse.SUPPRESS)
+    parser.add_argument("--result", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        child(args)
+        sys.exit(0)
+
+    rev = commit()
+    config = {k: getattr(args, k) for k in ("questions", "seed", "embed_latency", "generate_latency", "store_latency")}
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = {(r["entry_point"], r["pdf"]): r for r in json.load(f)["runs"]}
+
+    runs = []
+    for pdf in args.pdfs:
+        for entry_point in args.entry_points:
+            run = spawn(entry_point, pdf, args)
+            report(run, baseline.get((entry_point, run["pdf"])))
+            runs.append(run)
+
+    out = args.out or os.path.join(ROOT, ".cache", "bench", f"pipeline-{rev}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump({"commit": rev, "created": time.strftime("%Y-%m-%dT%H:%M:%S"), "config": config, "runs": runs},
+                  f, indent=2)
+    print(f"Results written to {out}")
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+# Startup time budget: python bench/startup_bench.py [--repeat 5] [--scale 1.0]
+# Times fresh interpreters importing api.py and running the cheap main.py commands
+# (--list-books, delete), and checks that they stay within their budgets without
+# importing the heavy SDKs. Exits non-zero when a budget is exceeded, so it can
+# gate CI.
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+import statistics
+
+ROOT   = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SAMPLE = os.path.join(ROOT, "book3.pdf")
+
+# modules that must not be imported until they are actually needed
+HEAVY = ("google.generativeai", "google.api_core", "fitz", "pymupdf", "pinecone")
+
+# (name, budget in seconds, code run in a fresh interpreter)
+CASES = [
+    ("import api", 1.5, "import api"),
+    ("main.py --list-books", 1.0,
+     f"import runpy, sys; sys.argv = ['main.py', {SAMPLE!r}, 'bench@example.com', '--list-books']; "
+     f"runpy.run_path({os.path.join(ROOT, 'main.py')!r}, run_name='__main__')"),
+    ("main.py delete", 1.0,
+     f"import runpy, sys; sys.argv = ['main.py', {SAMPLE!r}, 'bench@example.com', 'delete']; "
+     f"runpy.run_path({os.path.join(ROOT, 'main.py')!r}, run_name='__main__')"),
+]
+
+# reports the heavy modules loaded by the time the interpreter exits
+PROBE = (
+    "import atexit, json, sys\n"
+    "atexit.register(lambda: sys.stderr.write('\\nLOADED ' + json.dumps(sorted("
+    "h for h in %r if h in sys.modules)) + '\\n'))\n"
+) % (HEAVY,)
+
+
+def run(code: str, work: str) -> tuple:
+    env = dict(os.environ, GEMINI_API_KEY="bench", VECTOR_STORE="local", PYTHONPATH=ROOT)
+    t0 = time.perf_counter()
+    proc = subprocess.run([sys.executable, "-c", PROBE + code], cwd=work, env=env,
+                          stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    elapsed = time.perf_counter() - t0
+    if proc.returncode:
+        raise RuntimeError(f"failed:\n{proc.stderr[-4000:]}")
+    loaded = json.loads(proc.stderr.rsplit("LOADED ", 1)[1])
+    return elapsed, loaded
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check startup time budgets for api.py and main.py")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--scale", type=float, default=1.0, help="multiply every budget (slow CI machines)")
+    args = parser.parse_args()
+
+    failed = False
+    with tempfile.TemporaryDirectory(prefix="startup-bench-") as work:
+        for name, budget, code in CASES:
+            results = [run(code, work) for _ in range(args.repeat)]
+            median  = statistics.median(t for t, _ in results)
+            loaded  = results[-1][1]
+            limit   = budget * args.scale
+            ok      = median <= limit and not loaded
+            failed |= not ok
+            print(f"{'ok  ' if ok else 'FAIL'} {name:<22} median {median * 1000:7.0f} ms  "
+                  f"(budget {limit * 1000:.0f} ms)" + (f"  heavy imports: {', '.join(loaded)}" if loaded else ""))
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,154 @@
+import os
+import re
+import json
+import shutil
+import threading
+from collections import Counter, OrderedDict
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from vector_store import safe_name
+
+# === Per-book BM25 index ===
+# Built while a book is ingested and saved as one compressed .npz per book:
+# a sorted vocabulary with CSR-style postings (doc index, term frequency) and
+# document lengths. Doc index i is chunk i of the book.
+BM25_DIR    = os.getenv("BM25_DIR", ".cache/bm25")
+BM25_K1     = 1.5
+BM25_B      = 0.75
+BM25_LOADED = 64                # indexes kept in memory
+
+# words, numbers and dotted/hyphenated terms such as "3.2", "eq-5", "x-ray"
+TERM_RE = re.compile(r"[a-z0-9]+(?:[.\-][a-z0-9]+)*")
+
+
+def tokenize(text: str) -> List[str]:
+    return TERM_RE.findall(text.lower())
+
+
+def index_path(user_id: str, book_name: str) -> str:
+    return os.path.join(BM25_DIR, safe_name(user_id), safe_name(book_name) + ".npz")
+
+
+class BM25Builder:
+    def __init__(self):
+        self.postings: dict = {}
+        self.doc_len: List[int] = []
+
+    def add(self, text: str) -> None:
+        doc = len(self.doc_len)
+        terms = Counter(tokenize(text))
+        for term, tf in terms.items():
+            self.postings.setdefault(term, []).append((doc, tf))
+        self.doc_len.append(sum(terms.values()))
+
+    def tap(self, chunks: Iterable) -> Iterator:
+        # passes chunks through unchanged, indexing their text on the way
+        for chunk in chunks:
+            self.add(chunk if isinstance(chunk, str) else chunk.text)
+            yield chunk
+
+    def save(self, user_id: str, book_name: str) -> str:
+        vocab   = sorted(self.postings)
+        offsets = np.zeros(len(vocab) + 1, dtype=np.int64)
+        docs, tfs = [], []
+        for n, term in enumerate(vocab):
+            plist = self.postings[term]
+            offsets[n + 1] = offsets[n] + len(plist)
+            docs.extend(d for d, _ in plist)
+            tfs.extend(tf for _, tf in plist)
+        path = index_path(user_id, book_name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = path + ".tmp.npz"
+        np.savez_compressed(
+            tmp,
+            vocab=np.frombuffer(json.dumps(vocab).encode("utf-8"), dtype=np.uint8),
+            offsets=offsets,
+            docs=np.asarray(docs, dtype=np.int32),
+            tfs=np.minimum(np.asarray(tfs, dtype=np.int64), 65535).astype(np.uint16),
+            doc_len=np.asarray(self.doc_len, dtype=np.int32),
+        )
+        os.replace(tmp, path)
+        with _loaded_lock:
+            _loaded.pop(path, None)
+        return path
+
+
+class BM25Index:
+    def __init__(self, path: str):
+        with np.load(path) as data:
+            vocab        = json.loads(data["vocab"].tobytes().decode("utf-8"))
+            self.offsets = data["offsets"]
+            self.docs    = data["docs"]
+            self.tfs     = data["tfs"].astype(np.float32)
+            self.doc_len = data["doc_len"].astype(np.float32)
+        self.terms = {t: i for i, t in enumerate(vocab)}
+        self.n     = len(self.doc_len)
+        self.avgdl = float(self.doc_len.mean()) if self.n else 0.0
+
+    def search(self, query: str, top_k: int) -> List[Tuple[int, float]]:
+        # (doc index, score) of the best top_k chunks; scores accumulate per term
+        # over the postings slices with vectorized NumPy ops
+        if not self.n:
+            return []
+        scores = np.zeros(self.n, dtype=np.float32)
+        for term in set(tokenize(query)):
+            t = self.terms.get(term)
+            if t is None:
+                continue
+            lo, hi = self.offsets[t], self.offsets[t + 1]
+            docs, tf = self.docs[lo:hi], self.tfs[lo:hi]
+            idf = np.log1p((self.n - len(docs) + 0.5) / (len(docs) + 0.5))
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * self.doc_len[docs] / (self.avgdl or 1.0))
+            scores[docs] += idf * tf * (BM25_K1 + 1) / (tf + norm)
+        hits = np.flatnonzero(scores)
+        if not len(hits):
+            return []
+        k = min(top_k, len(hits))
+        top = hits[np.argpartition(-scores[hits], k - 1)[:k]]
+        top = top[np.argsort(-scores[top])]
+        return [(int(i), float(scores[i])) for i in top]
+
+
+_loaded: "OrderedDict[str, BM25Index]" = OrderedDict()
+_loaded_lock = threading.Lock()
+
+
+def load(user_id: str, book_name: str) -> Optional[BM25Index]:
+    path = index_path(user_id, book_name)
+    with _loaded_lock:
+        if path in _loaded:
+            _loaded.move_to_end(path)
+            return _loaded[path]
+    if not os.path.exists(path):
+        return None
+    idx = BM25Index(path)
+    with _loaded_lock:
+        _loaded[path] = idx
+        while len(_loaded) > BM25_LOADED:
+            _loaded.popitem(last=False)
+    return idx
+
+
+def remove(user_id: str, book_name: str) -> None:
+    path = index_path(user_id, book_name)
+    with _loaded_lock:
+        _loaded.pop(path, None)
+    if os.path.exists(path):
+        os.remove(path)
+
+
+def copy(src_user: str, src_book: str, user_id: str, book_name: str) -> bool:
+    # the index only refers to chunk positions, so a book with identical content
+    # reuses it as is; False if the source has no index
+    src, path = index_path(src_user, src_book), index_path(user_id, book_name)
+    if not os.path.exists(src):
+        return False
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + ".tmp.npz"
+    shutil.copyfile(src, tmp)
+    os.replace(tmp, path)
+    with _loaded_lock:
+        _loaded.pop(path, None)
+    return True
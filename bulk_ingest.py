@@ -0,0 +1,170 @@
+import os
+import sys
+import time
+import threading
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from typing import Dict, List, Optional, Set, Tuple
+
+import metrics
+from catalog import file_sha256, get_catalog
+from ingest import ingest_book, prepare_book
+from vector_store import VectorStore
+
+# === Bulk directory ingestion ===
+# `main.py ingest-dir <dir> <user_id>`: PDFs are extracted and chunked in a pool
+# of worker processes, and each prepared book is handed to ingest_book() on one
+# of a few threads. Those threads share this process's embedding rate limiter,
+# embedding cache and upsert settings, so the whole library goes through one
+# rate-limited embed/upsert stage. Books already indexed, or identical to one
+# that is, skip extraction.
+INGEST_PROCESSES = int(os.getenv("INGEST_PROCESSES", str(os.cpu_count() or 2)))  # extraction processes
+INGEST_BOOKS     = int(os.getenv("INGEST_BOOKS", "4"))          # books embedded and upserted at once
+PROGRESS_EVERY   = 1.0                                           # seconds between progress updates
+
+
+def find_pdfs(root: str) -> List[str]:
+    found = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        found += [os.path.join(dirpath, f) for f in sorted(filenames) if f.lower().endswith(".pdf")]
+    return found
+
+
+def book_name_for(root: str, path: str) -> str:
+    # the path below `root`, so same-named files in different folders stay apart;
+    # a flat folder gives the same names as `main.py <pdf_path>`
+    return os.path.relpath(path, root).replace(os.sep, "/")
+
+
+class BulkStats:
+    def __init__(self, total: int):
+        self.total    = total
+        self.done     = 0
+        self.pages    = 0
+        self.chunks   = 0
+        self.upserted = 0
+        self.statuses: Dict[str, int] = {}
+        self.failures: List[Tuple[str, str]] = []
+        self.started  = time.monotonic()
+        self.lock     = threading.Lock()
+
+    @property
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started
+
+    def rate(self, n: int) -> float:
+        return n / self.elapsed if self.elapsed > 0 else 0.0
+
+    def finish(self, result: dict, pages: int, chunks: int) -> None:
+        # pages and chunks count what was extracted; unchanged and linked books add none
+        with self.lock:
+            self.done     += 1
+            self.pages    += pages
+            self.chunks   += chunks
+            self.upserted += result["upserted"]
+            self.statuses[result["status"]] = self.statuses.get(result["status"], 0) + 1
+
+    def fail(self, path: str, error: BaseException) -> None:
+        with self.lock:
+            self.done += 1
+            self.failures.append((path, f"{type(error).__name__}: {error}"))
+
+    def line(self) -> str:
+        return (f"📚 {self.done}/{self.total} books, {self.pages} pages, {self.chunks} chunks "
+                f"({self.rate(self.pages):.1f} pages/sec, {self.rate(self.chunks):.1f} chunks/sec), "
+                f"{len(self.failures)} failed, {self.elapsed:.0f}s")
+
+    def summary(self) -> str:
+        statuses = ", ".join(f"{n} {status}" for status, n in sorted(self.statuses.items())) or "none"
+        lines = [
+            f"✅ Ingested {self.done - len(self.failures)}/{self.total} books in {self.elapsed:.1f}s ({statuses})",
+            f"   {self.pages} pages extracted ({self.rate(self.pages):.1f} pages/sec), {self.chunks} chunks "
+            f"({self.rate(self.chunks):.1f} chunks/sec), {self.upserted} vectors upserted",
+        ]
+        if self.failures:
+            lines.append(f"❌ {len(self.failures)} failed (rerun to resume them):")
+            lines += [f"   - {path}: {error}" for path, error in self.failures]
+        return "\n".join(lines)
+
+
+def skips_extraction(user_id: str, book_name: str, digest: str) -> bool:
+    # true when ingest_book() won't read the PDF: unchanged, or linked to an identical book
+    catalog = get_catalog()
+    book = catalog.get_book(user_id, book_name)
+    if book and book["content_hash"] == digest and catalog.checkpoint(user_id, book_name) is None:
+        return True
+    return catalog.find_by_hash(digest, exclude=(user_id, book_name)) is not None
+
+
+def ingest_dir(
+    store: VectorStore,
+    user_id: str,
+    root: str,
+    processes: int = INGEST_PROCESSES,
+    books: int = INGEST_BOOKS,
+    out=sys.stdout,
+) -> BulkStats:
+    # Ingests every PDF under `root` for the user and returns the counts. At most
+    # `processes + books` books are being prepared or waiting to be indexed, so
+    # memory stays bounded however large the library. A failed book is reported
+    # and the rest carry on; its checkpoint lets a rerun resume it.
+    paths = find_pdfs(root)
+    stats = BulkStats(len(paths))
+    get_catalog().ensure_user(user_id, store)
+    interactive = out.isatty()
+    shown = [0.0]                                   # when the last non-interactive line was printed
+
+    def index(path: str, digest: str, prepared: Optional[dict]) -> None:
+        try:
+            if prepared is not None:
+                metrics.observe("extract", prepared["extract_seconds"])
+                metrics.observe("chunk", prepared["chunk_seconds"])
+            with metrics.span("ingest"):
+                result = ingest_book(store, user_id, book_name_for(root, path), path, content_hash=digest,
+                                     prepared=(prepared["page_hashes"], prepared["chunks"]) if prepared else None,
+                                     echo=False)
+            stats.finish(result, len(prepared["page_hashes"]) if prepared else 0,
+                         len(prepared["chunks"]) if prepared else 0)
+        except Exception as e:
+            stats.fail(path, e)
+
+    def show(final: bool = False) -> None:
+        if interactive:
+            print(f"\r{stats.line()}", end="\n" if final else "", file=out, flush=True)
+        elif final or shown[0] + 10 * PROGRESS_EVERY <= time.monotonic():
+            print(stats.line(), file=out, flush=True)
+            shown[0] = time.monotonic()
+
+    todo  = iter(paths)
+    extracting: Dict[Future, Tuple[str, str]] = {}
+    indexing: Set[Future] = set()
+    with ProcessPoolExecutor(max_workers=processes) as extract_pool, \
+            ThreadPoolExecutor(max_workers=books, thread_name_prefix="bulk-ingest") as index_pool:
+        while True:
+            while len(extracting) + len(indexing) < processes + books:
+                path = next(todo, None)
+                if path is None:
+                    break
+                try:
+                    digest = file_sha256(path)
+                    if skips_extraction(user_id, book_name_for(root, path), digest):
+                        indexing.add(index_pool.submit(index, path, digest, None))
+                    else:
+                        extracting[extract_pool.submit(prepare_book, path)] = (path, digest)
+                except Exception as e:
+                    stats.fail(path, e)
+            if not extracting and not indexing:
+                break
+            done, _ = wait(set(extracting) | indexing, timeout=PROGRESS_EVERY, return_when=FIRST_COMPLETED)
+            for fut in done:
+                if fut in indexing:
+                    indexing.discard(fut)
+                    continue
+                path, digest = extracting.pop(fut)
+                try:
+                    indexing.add(index_pool.submit(index, path, digest, fut.result()))
+                except Exception as e:
+                    stats.fail(path, e)
+            show()
+    show(final=True)
+    return stats
@@ -0,0 +1,269 @@
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+from vector_store import DIMENSION, user_namespace
+
+load_dotenv()
+
+# === Per-user book catalog ===
+# user -> book -> chunk count, content hash, size and index time, kept in SQLite
+# so listing a library or checking a book never needs a vector query.
+CATALOG_PATH = os.getenv("CATALOG_PATH", ".cache/catalog.sqlite")
+
+
+def text_hash(text: str) -> str:
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=12).hexdigest()
+
+
+def file_sha256(path: str, block_size: int = 1 << 20) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+class Catalog:
+    def __init__(self, path: str = CATALOG_PATH):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.lock = threading.Lock()
+        self.db   = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS books ("
+            " user_id TEXT NOT NULL, book_name TEXT NOT NULL, chunk_count INTEGER NOT NULL,"
+            " content_hash TEXT, size_bytes INTEGER, indexed_at REAL NOT NULL,"
+            " PRIMARY KEY (user_id, book_name))"
+        )
+        # uploads are deduplicated on the file's SHA-256
+        self.db.execute("CREATE INDEX IF NOT EXISTS books_content_hash ON books(content_hash)")
+        # users whose pre-catalog vectors have been scanned into the catalog once
+        self.db.execute("CREATE TABLE IF NOT EXISTS backfilled (user_id TEXT PRIMARY KEY)")
+        # per-page and per-chunk content hashes of the indexed version, for incremental re-indexing
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS pages ("
+            " user_id TEXT NOT NULL, book_name TEXT NOT NULL, page_no INTEGER NOT NULL,"
+            " page_hash TEXT NOT NULL, PRIMARY KEY (user_id, book_name, page_no))"
+        )
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS chunks ("
+            " user_id TEXT NOT NULL, book_name TEXT NOT NULL, idx INTEGER NOT NULL,"
+            " text_hash TEXT NOT NULL, PRIMARY KEY (user_id, book_name, idx))"
+        )
+        # ingestion in progress: the file being indexed and the chunks already
+        # upserted, so an interrupted run resumes instead of starting over. A book
+        # only enters `books` once its ingestion completes.
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS checkpoints ("
+            " user_id TEXT NOT NULL, book_name TEXT NOT NULL, content_hash TEXT NOT NULL,"
+            " path TEXT NOT NULL, updated_at REAL NOT NULL, PRIMARY KEY (user_id, book_name))"
+        )
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS checkpoint_chunks ("
+            " user_id TEXT NOT NULL, book_name TEXT NOT NULL, idx INTEGER NOT NULL,"
+            " text_hash TEXT NOT NULL, PRIMARY KEY (user_id, book_name, idx))"
+        )
+
+    def record_book(self, user_id: str, book_name: str, chunk_count: int,
+                    content_hash: Optional[str] = None, size_bytes: Optional[int] = None,
+                    page_hashes: Optional[List[str]] = None, chunk_hashes: Optional[List[str]] = None) -> None:
+        key = (user_id, book_name)
+        with self.lock:
+            self.db.execute("BEGIN IMMEDIATE")
+            self.db.execute(
+                "INSERT OR REPLACE INTO books VALUES (?, ?, ?, ?, ?, ?)",
+                (user_id, book_name, chunk_count, content_hash, size_bytes, time.time())
+            )
+            if page_hashes is not None:
+                self.db.execute("DELETE FROM pages WHERE user_id = ? AND book_name = ?", key)
+                self.db.executemany("INSERT INTO pages VALUES (?, ?, ?, ?)",
+                                    [(*key, i, h) for i, h in enumerate(page_hashes)])
+            if chunk_hashes is not None:
+                self.db.execute("DELETE FROM chunks WHERE user_id = ? AND book_name = ?", key)
+                self.db.executemany("INSERT INTO chunks VALUES (?, ?, ?, ?)",
+                                    [(*key, i, h) for i, h in enumerate(chunk_hashes)])
+            self._clear_checkpoint(key)
+            self.db.execute("COMMIT")
+
+    def remove_book(self, user_id: str, book_name: str) -> bool:
+        key = (user_id, book_name)
+        with self.lock:
+            self.db.execute("BEGIN IMMEDIATE")
+            cur = self.db.execute("DELETE FROM books WHERE user_id = ? AND book_name = ?", key)
+            self.db.execute("DELETE FROM pages WHERE user_id = ? AND book_name = ?", key)
+            self.db.execute("DELETE FROM chunks WHERE user_id = ? AND book_name = ?", key)
+            self._clear_checkpoint(key)
+            self.db.execute("COMMIT")
+            return cur.rowcount > 0
+
+    def _clear_checkpoint(self, key: tuple) -> None:
+        self.db.execute("DELETE FROM checkpoints WHERE user_id = ? AND book_name = ?", key)
+        self.db.execute("DELETE FROM checkpoint_chunks WHERE user_id = ? AND book_name = ?", key)
+
+    def checkpoint(self, user_id: str, book_name: str) -> Optional[dict]:
+        # {"content_hash", "path", "chunks": {chunk index: text hash}} of an unfinished ingestion
+        key = (user_id, book_name)
+        with self.lock:
+            row = self.db.execute(
+                "SELECT content_hash, path FROM checkpoints WHERE user_id = ? AND book_name = ?", key
+            ).fetchone()
+            if row is None:
+                return None
+            chunks = self.db.execute(
+                "SELECT idx, text_hash FROM checkpoint_chunks WHERE user_id = ? AND book_name = ?", key
+            ).fetchall()
+        return {"content_hash": row[0], "path": row[1], "chunks": dict(chunks)}
+
+    def start_checkpoint(self, user_id: str, book_name: str, content_hash: str, path: str) -> None:
+        # committed chunks are kept when the same content is resumed, dropped otherwise
+        key = (user_id, book_name)
+        with self.lock:
+            self.db.execute("BEGIN IMMEDIATE")
+            row = self.db.execute(
+                "SELECT content_hash FROM checkpoints WHERE user_id = ? AND book_name = ?", key
+            ).fetchone()
+            if row is not None and row[0] != content_hash:
+                self._clear_checkpoint(key)
+            self.db.execute("INSERT OR REPLACE INTO checkpoints VALUES (?, ?, ?, ?, ?)",
+                            (*key, content_hash, path, time.time()))
+            self.db.execute("COMMIT")
+
+    def commit_chunks(self, user_id: str, book_name: str, chunks: List[Tuple[int, str]]) -> None:
+        # (chunk index, text hash) of chunks whose vectors and texts are stored
+        key = (user_id, book_name)
+        with self.lock:
+            self.db.execute("BEGIN IMMEDIATE")
+            self.db.executemany("INSERT OR REPLACE INTO checkpoint_chunks VALUES (?, ?, ?, ?)",
+                                [(*key, i, h) for i, h in chunks])
+            self.db.execute("UPDATE checkpoints SET updated_at = ? WHERE user_id = ? AND book_name = ?",
+                            (time.time(), *key))
+            self.db.execute("COMMIT")
+
+    def list_checkpoints(self) -> List[Dict[str, str]]:
+        with self.lock:
+            rows = self.db.execute(
+                "SELECT user_id, book_name, content_hash, path FROM checkpoints ORDER BY updated_at"
+            ).fetchall()
+        return [dict(zip(("user_id", "book_name", "content_hash", "path"), r)) for r in rows]
+
+    def page_hashes(self, user_id: str, book_name: str) -> List[str]:
+        with self.lock:
+            rows = self.db.execute(
+                "SELECT page_hash FROM pages WHERE user_id = ? AND book_name = ? ORDER BY page_no",
+                (user_id, book_name)
+            ).fetchall()
+        return [r[0] for r in rows]
+
+    def chunk_hashes(self, user_id: str, book_name: str) -> List[str]:
+        with self.lock:
+            rows = self.db.execute(
+                "SELECT text_hash FROM chunks WHERE user_id = ? AND book_name = ? ORDER BY idx",
+                (user_id, book_name)
+            ).fetchall()
+        return [r[0] for r in rows]
+
+    def get_book(self, user_id: str, book_name: str) -> Optional[dict]:
+        with self.lock:
+            row = self.db.execute(
+                "SELECT user_id, book_name, chunk_count, content_hash, size_bytes, indexed_at"
+                " FROM books WHERE user_id = ? AND book_name = ?", (user_id, book_name)
+            ).fetchone()
+        if row is None:
+            return None
+        keys = ("user_id", "book_name", "chunk_count", "content_hash", "size_bytes", "indexed_at")
+        return dict(zip(keys, row))
+
+    def chunk_extent(self, user_id: str, book_name: str) -> Optional[int]:
+        # Number of chunk ids the book may be using: its chunk count, or more when an
+        # interrupted re-index of a longer version committed chunks past it. None for
+        # books not in the catalog.
+        key = (user_id, book_name)
+        with self.lock:
+            row = self.db.execute("SELECT chunk_count FROM books WHERE user_id = ? AND book_name = ?", key).fetchone()
+            top = self.db.execute(
+                "SELECT MAX(idx) FROM checkpoint_chunks WHERE user_id = ? AND book_name = ?", key
+            ).fetchone()[0]
+        if row is None:
+            return None
+        return max(row[0], top + 1 if top is not None else 0)
+
+    def find_by_hash(self, content_hash: str, exclude: Optional[tuple] = None) -> Optional[dict]:
+        # an indexed book with these exact bytes, other than `exclude` (user_id, book_name)
+        with self.lock:
+            rows = self.db.execute(
+                "SELECT user_id, book_name FROM books WHERE content_hash = ? AND chunk_count > 0"
+                " ORDER BY indexed_at", (content_hash,)
+            ).fetchall()
+        for key in rows:
+            if key != tuple(exclude or ()):
+                return self.get_book(*key)
+        return None
+
+    def list_books(self, user_id: str) -> List[str]:
+        with self.lock:
+            rows = self.db.execute(
+                "SELECT book_name FROM books WHERE user_id = ? ORDER BY book_name", (user_id,)
+            ).fetchall()
+        return [r[0] for r in rows]
+
+    def ensure_user(self, user_id: str, store) -> None:
+        # Books indexed before the catalog existed are picked up once per user from
+        # the vector ids ("{user}-{book}-chunk-{i}"). Each candidate book is confirmed
+        # with one filtered query, since the id prefix alone is ambiguous when user
+        # ids contain "-".
+        with self.lock:
+            if self.db.execute("SELECT 1 FROM backfilled WHERE user_id = ?", (user_id,)).fetchone():
+                return
+        prefix    = f"{user_id}-"
+        namespace = user_namespace(user_id)
+        counts = {}
+        for page in store.list_ids(prefix=prefix, namespace=namespace):
+            for id_ in page:
+                book, sep, _ = id_[len(prefix):].rpartition("-chunk-")
+                if sep:
+                    counts[book] = counts.get(book, 0) + 1
+        confirmed = {
+            book: n for book, n in counts.items()
+            if store.query(vector=[0.0] * DIMENSION, top_k=1, include_metadata=False,
+                           filter={"user_id": user_id, "book_name": book}, namespace=namespace)
+        }
+        with self.lock:
+            self.db.execute("BEGIN IMMEDIATE")
+            for book, n in confirmed.items():
+                self._register(user_id, book, n)
+            self.db.execute("INSERT OR IGNORE INTO backfilled VALUES (?)", (user_id,))
+            self.db.execute("COMMIT")
+
+    def register_books(self, counts: dict) -> None:
+        # {(user_id, book_name): chunk count} of books found in the index (e.g. by a
+        # namespace migration) that the catalog may not know yet; known books are kept
+        with self.lock:
+            self.db.execute("BEGIN IMMEDIATE")
+            for (user_id, book), n in counts.items():
+                self._register(user_id, book, n)
+            self.db.execute("COMMIT")
+
+    def _register(self, user_id: str, book_name: str, chunk_count: int) -> None:
+        self.db.execute(
+            "INSERT OR IGNORE INTO books VALUES (?, ?, ?, NULL, NULL, ?)",
+            (user_id, book_name, chunk_count, time.time())
+        )
+
+
+_catalog: Optional[Catalog] = None
+_catalog_lock = threading.Lock()
+
+
+def get_catalog() -> Catalog:
+    global _catalog
+    with _catalog_lock:
+        if _catalog is None:
+            _catalog = Catalog()
+        return _catalog
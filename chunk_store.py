@@ -0,0 +1,69 @@
+import os
+import zlib
+import sqlite3
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# === Local chunk text store ===
+# Chunk text lives here, zlib-compressed and keyed by vector id, instead of in
+# vector metadata: upserts and query responses stay small and the text of all
+# retrieved chunks is read back in one batched lookup.
+CHUNK_STORE_PATH  = os.getenv("CHUNK_STORE_PATH", ".cache/chunks.sqlite")
+CHUNK_STORE_LEVEL = 6                       # zlib level: ~2-3x smaller text at negligible CPU
+
+
+class ChunkStore:
+    def __init__(self, path: str = CHUNK_STORE_PATH):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.lock = threading.Lock()
+        self.db   = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS chunk_texts ("
+            " id TEXT PRIMARY KEY, user_id TEXT NOT NULL, book_name TEXT NOT NULL, body BLOB NOT NULL)"
+        )
+        self.db.execute("CREATE INDEX IF NOT EXISTS chunk_texts_book ON chunk_texts(user_id, book_name)")
+        self.db.commit()
+
+    def put_many(self, user_id: str, book_name: str, items: Iterable[Tuple[str, str]]) -> None:
+        # items: (vector id, text)
+        rows = [(id_, user_id, book_name, zlib.compress(text.encode("utf-8"), CHUNK_STORE_LEVEL))
+                for id_, text in items]
+        with self.lock:
+            self.db.executemany("INSERT OR REPLACE INTO chunk_texts VALUES (?, ?, ?, ?)", rows)
+            self.db.commit()
+
+    def get_many(self, ids: List[str]) -> Dict[str, str]:
+        found: Dict[str, str] = {}
+        with self.lock:
+            for i in range(0, len(ids), 500):        # stay under SQLite's variable limit
+                part = ids[i:i + 500]
+                marks = ",".join("?" * len(part))
+                rows = self.db.execute(f"SELECT id, body FROM chunk_texts WHERE id IN ({marks})", part).fetchall()
+                found.update((id_, zlib.decompress(body).decode("utf-8")) for id_, body in rows)
+        return found
+
+    def delete(self, ids: List[str]) -> None:
+        with self.lock:
+            self.db.executemany("DELETE FROM chunk_texts WHERE id = ?", [(id_,) for id_ in ids])
+            self.db.commit()
+
+    def delete_book(self, user_id: str, book_name: str) -> int:
+        with self.lock:
+            cur = self.db.execute("DELETE FROM chunk_texts WHERE user_id = ? AND book_name = ?",
+                                  (user_id, book_name))
+            self.db.commit()
+            return cur.rowcount
+
+
+_store: Optional[ChunkStore] = None
+_store_lock = threading.Lock()
+
+
+def get_chunk_store() -> ChunkStore:
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = ChunkStore()
+        return _store
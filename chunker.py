@@ -0,0 +1,125 @@
+import os
+import re
+from bisect import bisect_right
+from typing import Iterable, Iterator, List, NamedTuple, Tuple
+
+# === Structure-aware chunking ===
+CHUNK_TOKENS  = int(os.getenv("CHUNK_TOKENS", "120"))     # max tokens per chunk
+CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP", "20"))     # tokens repeated from the previous chunk
+
+# a sentence ends after ./!/? (plus closing quotes/brackets) and whitespace;
+# a blank line always ends a paragraph. The leading class lets the regex engine
+# skip straight to candidate characters.
+BOUNDARY_RE = re.compile(r"[.!?\n](?:(?<=[.!?])[\"')\]]*\s+|(?<=\n)[ \t]*\n\s*)")
+# tokens are approximated by whitespace-separated words: str.split() runs in C
+# and tracks the model tokenizer closely enough for sizing chunks
+WORD_RE     = re.compile(r"\S+")
+
+
+class Chunk(NamedTuple):
+    text: str
+    page_start: int         # 0-based page numbers, inclusive
+    page_end: int
+    char_start: int         # offsets into the page texts joined with "\n"
+    char_end: int
+
+
+class _Unit(NamedTuple):
+    start: int
+    text: str
+    tokens: int
+
+
+def count_tokens(text: str) -> int:
+    return len(text.split())
+
+
+def _split_units(text: str, base: int) -> List[_Unit]:
+    # sentence/paragraph spans that exactly partition `text`
+    units, pos = [], 0
+    for end in [m.end() for m in BOUNDARY_RE.finditer(text)] + [len(text)]:
+        if end > pos:
+            span = text[pos:end]
+            units.append(_Unit(base + pos, span, len(span.split())))
+            pos = end
+    return units
+
+
+def _split_long(unit: _Unit, max_tokens: int) -> List[_Unit]:
+    # a single sentence longer than max_tokens is cut between tokens
+    starts = [m.start() for m in WORD_RE.finditer(unit.text)][::max_tokens] + [len(unit.text)]
+    starts[0] = 0
+    return [
+        _Unit(unit.start + a, unit.text[a:b], min(max_tokens, unit.tokens - i * max_tokens))
+        for i, (a, b) in enumerate(zip(starts, starts[1:]))
+    ]
+
+
+def iter_chunks(
+    pages: Iterable[Tuple[int, str]],
+    max_tokens: int = CHUNK_TOKENS,
+    overlap: int = CHUNK_OVERLAP,
+) -> Iterator[Chunk]:
+    # Packs whole sentences into chunks of at most max_tokens, starting each new
+    # chunk with up to `overlap` tokens of trailing sentences from the previous
+    # one. Consumes (page_number, text) lazily; only the current page and the
+    # unfinished sentence carried over from the previous one are buffered.
+    page_offsets: List[int] = []
+    page_numbers: List[int] = []
+
+    def page_at(offset: int) -> int:
+        return page_numbers[bisect_right(page_offsets, offset) - 1]
+
+    def emit(units: List[_Unit]) -> Iterator[Chunk]:
+        raw   = "".join(u.text for u in units)
+        text  = raw.strip()
+        if not text:
+            return
+        start = units[0].start + (len(raw) - len(raw.lstrip()))
+        end   = start + len(text)
+        yield Chunk(text, page_at(start), page_at(end - 1), start, end)
+
+    current: List[_Unit] = []
+    tokens  = 0
+
+    def add(unit: _Unit) -> Iterator[Chunk]:
+        nonlocal current, tokens
+        if current and tokens + unit.tokens > max_tokens:
+            yield from emit(current)
+            keep, kept = [], 0
+            for u in reversed(current):
+                if kept + u.tokens > overlap:
+                    break
+                keep.insert(0, u)
+                kept += u.tokens
+            if kept + unit.tokens > max_tokens:
+                keep, kept = [], 0
+            current, tokens = keep, kept
+        current.append(unit)
+        tokens += unit.tokens
+
+    def feed(units: List[_Unit]) -> Iterator[Chunk]:
+        for unit in units:
+            for part in (_split_long(unit, max_tokens) if unit.tokens > max_tokens else [unit]):
+                yield from add(part)
+
+    carry, carry_start, offset = "", 0, 0
+    for n, (page_no, page_text) in enumerate(pages):
+        sep = "\n" if n else ""
+        page_offsets.append(offset + len(sep))
+        page_numbers.append(page_no)
+        offset += len(sep) + len(page_text)
+
+        units = _split_units(carry + sep + page_text, carry_start)
+        # the last span may continue on the next page
+        if units:
+            yield from feed(units[:-1])
+            carry, carry_start = units[-1].text, units[-1].start
+
+    yield from feed(_split_units(carry, carry_start))
+    if current:
+        yield from emit(current)
+
+
+def chunk_text(text: str, max_tokens: int = CHUNK_TOKENS, overlap: int = CHUNK_OVERLAP) -> List[str]:
+    return [c.text for c in iter_chunks([(0, text)], max_tokens, overlap)]
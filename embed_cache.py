@@ -0,0 +1,109 @@
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+from typing import Dict, List, Optional
+
+import numpy as np
+
+# === Persistent embedding cache ===
+# Embeddings keyed by sha256(model, task_type, text), shared by every user and
+# re-upload. Vectors are stored as raw float16/float32 bytes and the least
+# recently used rows are evicted once the cache grows past EMBED_CACHE_MAX_MB.
+EMBED_CACHE_PATH   = os.getenv("EMBED_CACHE_PATH", ".cache/embeddings.sqlite")
+EMBED_CACHE_MAX_MB = float(os.getenv("EMBED_CACHE_MAX_MB", "1024"))
+EMBED_CACHE_DTYPE  = os.getenv("EMBED_CACHE_DTYPE", "float16")
+
+
+def cache_key(model: str, task_type: str, text: str) -> str:
+    h = hashlib.sha256()
+    for part in (model, task_type, text):
+        h.update(part.encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+class EmbeddingCache:
+    def __init__(self, path: str = EMBED_CACHE_PATH, max_mb: float = EMBED_CACHE_MAX_MB,
+                 dtype: str = EMBED_CACHE_DTYPE):
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.dtype     = np.dtype(dtype)
+        self.lock      = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " key TEXT PRIMARY KEY, dtype TEXT NOT NULL, vec BLOB NOT NULL,"
+            " size INTEGER NOT NULL, last_used REAL NOT NULL)"
+        )
+        self.db.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings(last_used)")
+        self.db.commit()
+        self.total_bytes = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM embeddings").fetchone()[0]
+
+    def get_many(self, keys: List[str]) -> Dict[str, np.ndarray]:
+        found: Dict[str, np.ndarray] = {}
+        with self.lock:
+            for i in range(0, len(keys), 500):       # stay under SQLite's variable limit
+                part = keys[i:i + 500]
+                marks = ",".join("?" * len(part))
+                rows = self.db.execute(
+                    f"SELECT key, dtype, vec FROM embeddings WHERE key IN ({marks})", part
+                ).fetchall()
+                for key, dtype, blob in rows:
+                    found[key] = np.frombuffer(blob, dtype=dtype).astype(np.float32)
+                if rows:
+                    self.db.execute(
+                        f"UPDATE embeddings SET last_used = ? WHERE key IN ({marks})", [time.time(), *part]
+                    )
+            self.db.commit()
+        return found
+
+    def put_many(self, items: Dict[str, np.ndarray]) -> None:
+        now  = time.time()
+        rows = []
+        for key, emb in items.items():
+            blob = np.asarray(emb, dtype=self.dtype).tobytes()
+            rows.append((key, self.dtype.name, blob, len(blob), now))
+        keys = list(items)
+        with self.lock:
+            # total_bytes is kept current: new blobs are added, the rows they replace subtracted
+            replaced = 0
+            for i in range(0, len(keys), 500):       # stay under SQLite's variable limit
+                part = keys[i:i + 500]
+                marks = ",".join("?" * len(part))
+                replaced += self.db.execute(
+                    f"SELECT COALESCE(SUM(size), 0) FROM embeddings WHERE key IN ({marks})", part
+                ).fetchone()[0]
+            self.db.executemany("INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?, ?, ?)", rows)
+            self.total_bytes += sum(row[3] for row in rows) - replaced
+            if self.total_bytes > self.max_bytes:
+                self._evict()
+            self.db.commit()
+
+    def _evict(self) -> None:
+        # drop least recently used rows until we are 10% under the budget
+        target = int(self.max_bytes * 0.9)
+        cur = self.db.execute("SELECT key, size FROM embeddings ORDER BY last_used")
+        doomed = []
+        for key, size in cur:
+            if self.total_bytes <= target:
+                break
+            doomed.append((key,))
+            self.total_bytes -= size
+        cur.close()
+        self.db.executemany("DELETE FROM embeddings WHERE key = ?", doomed)
+
+
+_cache: Optional[EmbeddingCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_cache() -> EmbeddingCache:
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = EmbeddingCache()
+        return _cache
@@ -0,0 +1,70 @@
+import os
+import asyncio
+import threading
+from typing import Dict
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# === Lazily configured Gemini client ===
+# google.generativeai takes about half a second to import, so it is only imported
+# and configured on the first embedding or generation call, not at startup.
+GENERATION_MODEL = "models/gemini-1.5-pro-001"
+# The async calls (generate_content_async, embed_content_async) share one
+# grpc.aio channel per process, so concurrent questions reuse its connections.
+EMBED_TIMEOUT    = float(os.getenv("EMBED_TIMEOUT", "10"))       # seconds per query embedding
+GEMINI_TIMEOUT   = float(os.getenv("GEMINI_TIMEOUT", "60"))      # seconds to the first (and between) answer tokens
+
+_genai  = None
+_models: Dict[str, object] = {}
+_lock   = threading.Lock()
+
+
+def api_key() -> str:
+    key = os.getenv("GEMINI_API_KEY")
+    if not key:
+        raise RuntimeError("GEMINI_API_KEY missing in .env")
+    return key
+
+
+def client():
+    # the configured google.generativeai module
+    global _genai
+    with _lock:
+        if _genai is None:
+            import google.generativeai as genai
+            genai.configure(api_key=api_key())
+            _genai = genai
+        return _genai
+
+
+def model(name: str = GENERATION_MODEL):
+    genai = client()
+    with _lock:
+        if name not in _models:
+            _models[name] = genai.GenerativeModel(name)
+        return _models[name]
+
+
+async def client_async():
+    # client() without blocking the event loop on the first (importing) call
+    return _genai if _genai is not None else await asyncio.to_thread(client)
+
+
+async def model_async(name: str = GENERATION_MODEL):
+    model_ = _models.get(name)
+    return model_ if model_ is not None else await asyncio.to_thread(model, name)
+
+
+def retryable_errors():
+    # (errors worth retrying: quota, overload, timeouts; the throttling subset)
+    from google.api_core import exceptions as gexc
+    retryable = (
+        gexc.ResourceExhausted,
+        gexc.TooManyRequests,
+        gexc.ServiceUnavailable,
+        gexc.DeadlineExceeded,
+        gexc.InternalServerError,
+    )
+    return retryable, (gexc.ResourceExhausted, gexc.TooManyRequests)
@@ -0,0 +1,503 @@
+import os
+import time
+import queue
+import random
+import logging
+import threading
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from itertools import islice
+from typing import Callable, Deque, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+from dotenv import load_dotenv
+
+import bm25
+import gemini
+import metrics
+import scheduler
+from catalog import file_sha256, get_catalog, text_hash
+from chunk_store import get_chunk_store
+from chunker import iter_chunks
+from embed_cache import cache_key, get_cache
+from pdf_extract import iter_pages
+from vector_store import VectorStore, chunk_id, namespace_for
+
+load_dotenv()
+
+logger = logging.getLogger("uvicorn.error")
+
+# === Embedding pipeline config ===
+EMBED_MODEL       = "models/embedding-001"
+EMBED_BATCH_SIZE  = int(os.getenv("EMBED_BATCH_SIZE", "50"))      # contents per embed call (API max 100)
+EMBED_WORKERS     = int(os.getenv("EMBED_WORKERS", "4"))          # concurrent embed calls
+EMBED_RATE        = float(os.getenv("EMBED_RATE", "2.0"))         # embed calls per second
+EMBED_MAX_RETRIES = int(os.getenv("EMBED_MAX_RETRIES", "6"))
+UPSERT_BATCH_SIZE = int(os.getenv("UPSERT_BATCH_SIZE", "50"))     # vectors per upsert call
+UPSERT_WORKERS    = int(os.getenv("UPSERT_WORKERS", "2"))         # concurrent upsert calls
+UPSERT_QUEUE      = int(os.getenv("UPSERT_QUEUE", "8"))           # batches buffered between embed and upsert
+
+# === Adaptive token bucket ===
+class TokenBucket:
+    # Refills at `rate` tokens/sec up to `burst`. On throttling the rate is halved,
+    # and every success nudges it back up towards `max_rate` (AIMD).
+    def __init__(self, rate: float, burst: Optional[float] = None, min_rate: float = 0.1):
+        self.max_rate = rate
+        self.min_rate = min_rate
+        self.rate     = rate
+        self.burst    = burst or max(1.0, rate)
+        self.tokens   = self.burst
+        self.updated  = time.monotonic()
+        self.lock     = threading.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens  = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, tokens: float = 1.0) -> None:
+        while True:
+            with self.lock:
+                self._refill()
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+                wait = (tokens - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def on_success(self) -> None:
+        with self.lock:
+            self.rate = min(self.max_rate, self.rate + self.max_rate * 0.05)
+
+    def on_throttle(self) -> None:
+        with self.lock:
+            self.rate   = max(self.min_rate, self.rate / 2)
+            self.tokens = 0.0
+
+
+# shared by every ingestion in this process so concurrent uploads respect one quota
+limiter = TokenBucket(EMBED_RATE, burst=EMBED_WORKERS)
+
+
+# === Batched embedding with retry ===
+def embed_batch(texts: List[str], task_type: str = "retrieval_document", user_id: str = "",
+                priority: str = scheduler.BULK) -> List[np.ndarray]:
+    # the rate limiter paces the quota; the scheduler's slot is only held for the call itself
+    genai = gemini.client()
+    retryable, throttled = gemini.retryable_errors()
+    for attempt in range(EMBED_MAX_RETRIES + 1):
+        limiter.acquire()
+        try:
+            with scheduler.get_scheduler().slot(user_id, priority):
+                resp = genai.embed_content(
+                    model=EMBED_MODEL,
+                    content=texts,
+                    task_type=task_type,
+                    title="book content" if task_type == "retrieval_document" else None
+                )
+            limiter.on_success()
+            return [np.array(e, dtype=np.float32) for e in resp["embedding"]]
+        except retryable as e:
+            if isinstance(e, throttled):
+                limiter.on_throttle()
+            if attempt == EMBED_MAX_RETRIES:
+                raise
+            # exponential backoff with full jitter
+            time.sleep(random.uniform(0, min(30.0, 0.5 * 2 ** attempt)))
+
+
+class EmbedStats:
+    def __init__(self, total: int = 0):
+        self.total   = total      # grows while chunks are still being produced upstream
+        self.cached  = 0
+        self.done    = 0
+        self.started = time.monotonic()
+        self.lock    = threading.Lock()
+
+    @property
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started
+
+    @property
+    def chunks_per_sec(self) -> float:
+        return self.done / self.elapsed if self.elapsed > 0 else 0.0
+
+    def add(self, n: int, cached: int = 0) -> None:
+        with self.lock:
+            self.done   += n
+            self.cached += cached
+
+    def __str__(self) -> str:
+        return (f"{self.done}/{self.total} chunks ({self.cached} cached) in {self.elapsed:.1f}s "
+                f"({self.chunks_per_sec:.1f} chunks/sec)")
+
+
+def _embed_cached(batch: List[str], task_type: str, user_id: str = "") -> Tuple[List[np.ndarray], int]:
+    # Serves what it can from the embedding cache, embeds the rest (deduplicated)
+    # in one API call and returns (embeddings in batch order, number of cache hits).
+    cache  = get_cache()
+    keys   = [cache_key(EMBED_MODEL, task_type, c) for c in batch]
+    found  = cache.get_many(list(set(keys)))
+    hits   = sum(1 for k in keys if k in found)
+    todo   = {k: c for k, c in zip(keys, batch) if k not in found}
+    metrics.count("chunks_cached", hits)
+    if todo:
+        with metrics.span("embed"):
+            fresh = dict(zip(todo, embed_batch(list(todo.values()), task_type, user_id)))
+        metrics.count("chunks_embedded", len(todo))
+        cache.put_many(fresh)
+        found.update(fresh)
+    return [found[k] for k in keys], hits
+
+
+def _text(chunk) -> str:
+    return chunk if isinstance(chunk, str) else chunk.text
+
+
+def iter_embeddings(
+    chunks: Iterable,
+    task_type: str = "retrieval_document",
+    batch_size: int = EMBED_BATCH_SIZE,
+    workers: int = EMBED_WORKERS,
+    progress: Optional[Callable[[EmbedStats], None]] = None,
+    stats: Optional[EmbedStats] = None,
+    text_of: Callable = _text,
+    echo: bool = True,
+    user_id: str = "",
+) -> Iterator[Tuple[object, np.ndarray]]:
+    # Pulls chunks (strings or chunker.Chunk) lazily, embeds them in multi-content
+    # batches across a bounded worker pool and yields (chunk, embedding) in input order. At most
+    # 2 * workers batches are in flight, so a slow consumer or a still-running
+    # producer (e.g. page-by-page PDF extraction) keeps memory bounded. API calls
+    # are queued as bulk work of `user_id` in the scheduler.
+    stats = stats or EmbedStats()
+    it    = iter(chunks)
+
+    def run(batch: list) -> List[np.ndarray]:
+        embs, hits = _embed_cached([text_of(c) for c in batch], task_type, user_id)
+        stats.add(len(batch), cached=hits)
+        if echo:
+            print(f"Embedded {stats}")
+        if progress:
+            progress(stats)
+        return embs
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        inflight: Deque[Tuple[List[str], Future]] = deque()
+        exhausted = False
+        while inflight or not exhausted:
+            while not exhausted and len(inflight) < 2 * workers:
+                batch = list(islice(it, batch_size))
+                if not batch:
+                    exhausted = True
+                    break
+                with stats.lock:
+                    stats.total += len(batch)
+                inflight.append((batch, pool.submit(run, batch)))
+            if inflight:
+                batch, fut = inflight.popleft()
+                yield from zip(batch, fut.result())
+
+    if echo:
+        print(f"✅ Embedding finished: {stats}")
+
+
+# === Pipelined indexing ===
+def chunk_vector(user_id: str, book_name: str, i: int, chunk, emb: np.ndarray) -> dict:
+    # the chunk text itself goes to the local chunk store, not into metadata
+    return {
+        "id":       chunk_id(user_id, book_name, i),
+        "values":   emb.tolist(),
+        "metadata": {
+            "user_id": user_id,
+            "book_name": book_name,
+            "page_start": chunk.page_start,
+            "page_end": chunk.page_end,
+            "char_start": chunk.char_start,
+            "char_end": chunk.char_end
+        }
+    }
+
+
+def index_chunks(
+    store: VectorStore,
+    user_id: str,
+    book_name: str,
+    numbered: Iterable[Tuple[int, object]],
+    progress: Optional[Callable[[EmbedStats], None]] = None,
+    on_upsert: Optional[Callable[[int], None]] = None,
+    on_commit: Optional[Callable[[List[int]], None]] = None,
+    echo: bool = True,
+) -> int:
+    # Embeds (chunk index, chunk) pairs and upserts them as a producer/consumer
+    # pipeline: batches of UPSERT_BATCH_SIZE vectors go through a bounded queue to
+    # UPSERT_WORKERS upsert threads as soon as they are embedded, so network I/O
+    # overlaps with embedding and peak memory does not grow with the length of
+    # the book. Chunk texts are written to the local chunk store before their
+    # vectors are queued, so every upserted vector has its text available.
+    # `on_commit` gets the chunk indexes of every batch once it is upserted.
+    # Returns the number of chunks upserted.
+    batches: "queue.Queue[Optional[Tuple[List[dict], List[int]]]]" = queue.Queue(maxsize=UPSERT_QUEUE)
+    errors: List[BaseException] = []
+    texts = get_chunk_store()
+    namespace = namespace_for(user_id, book_name)
+
+    def consume() -> None:
+        while True:
+            item = batches.get()
+            if item is None:
+                return
+            if errors:
+                continue                    # keep draining so the producer never blocks
+            batch, positions = item
+            try:
+                with metrics.span("upsert"):
+                    store.upsert(batch, namespace=namespace)
+                metrics.count("vectors_upserted", len(batch))
+                if on_commit:
+                    on_commit(positions)
+                if on_upsert:
+                    on_upsert(len(batch))
+            except BaseException as e:
+                errors.append(e)
+
+    workers = [threading.Thread(target=consume, name="upsert", daemon=True) for _ in range(UPSERT_WORKERS)]
+    for t in workers:
+        t.start()
+
+    def flush(batch: List[dict], batch_texts: List[Tuple[str, str]], positions: List[int]) -> None:
+        texts.put_many(user_id, book_name, batch_texts)
+        batches.put((batch, positions))
+
+    count, batch, batch_texts, positions = 0, [], [], []
+    try:
+        for (i, chunk), emb in iter_embeddings(numbered, progress=progress, text_of=lambda item: item[1].text,
+                                            echo=echo, user_id=user_id):
+            if errors:
+                break
+            batch.append(chunk_vector(user_id, book_name, i, chunk, emb))
+            batch_texts.append((batch[-1]["id"], chunk.text))
+            positions.append(i)
+            count += 1
+            if len(batch) >= UPSERT_BATCH_SIZE:
+                flush(batch, batch_texts, positions)
+                batch, batch_texts, positions = [], [], []
+        if batch and not errors:
+            flush(batch, batch_texts, positions)
+    finally:
+        for _ in workers:
+            batches.put(None)
+        for t in workers:
+            t.join()
+
+    if errors:
+        raise errors[0]
+    return count
+
+
+# === Content-addressed deduplication ===
+def copy_vectors(
+    store: VectorStore,
+    source: dict,
+    user_id: str,
+    book_name: str,
+    on_upsert: Optional[Callable[[int], None]] = None,
+) -> int:
+    # Copies the vectors and chunk texts of the catalogued book `source` to
+    # (user_id, book_name) in UPSERT_BATCH_SIZE batches: same embeddings and
+    # metadata, new ids and owner. Raises LookupError if any source vector is
+    # gone, so the caller can fall back to a full ingestion.
+    texts = get_chunk_store()
+    count, copied = source["chunk_count"], 0
+    src_namespace, namespace = namespace_for(source["user_id"], source["book_name"]), namespace_for(user_id, book_name)
+    for start in range(0, count, UPSERT_BATCH_SIZE):
+        positions = range(start, min(start + UPSERT_BATCH_SIZE, count))
+        old_ids   = [chunk_id(source["user_id"], source["book_name"], i) for i in positions]
+        with metrics.span("vector_fetch"):
+            found = store.fetch(old_ids, include_values=True, namespace=src_namespace)
+        if len(found) < len(old_ids):
+            raise LookupError(f"{len(old_ids) - len(found)} vectors of '{source['book_name']}' are missing")
+        old_texts = texts.get_many(old_ids)
+        batch, batch_texts = [], []
+        for i, old in zip(positions, old_ids):
+            m = found[old]
+            batch.append({"id": chunk_id(user_id, book_name, i), "values": list(m.values),
+                          "metadata": {**m.metadata, "user_id": user_id, "book_name": book_name}})
+            if old in old_texts:
+                batch_texts.append((batch[-1]["id"], old_texts[old]))
+        texts.put_many(user_id, book_name, batch_texts)
+        with metrics.span("upsert"):
+            store.upsert(batch, namespace=namespace)
+        metrics.count("vectors_upserted", len(batch))
+        if on_upsert:
+            on_upsert(len(batch))
+        copied += len(batch)
+    return copied
+
+
+def _changed_pages(old_pages: List[str], page_hashes: List[str]) -> List[int]:
+    changed = [p for p, h in enumerate(page_hashes) if p >= len(old_pages) or old_pages[p] != h]
+    return changed + list(range(len(page_hashes), len(old_pages)))
+
+
+def link_book(
+    store: VectorStore,
+    source: dict,
+    user_id: str,
+    book_name: str,
+    path: str,
+    on_upsert: Optional[Callable[[int], None]] = None,
+    echo: bool = True,
+) -> dict:
+    # Indexes a PDF whose bytes are identical to the already indexed `source`
+    # from that book's vectors, chunk texts, BM25 index and hashes, with no
+    # extraction or embedding.
+    catalog    = get_catalog()
+    previous   = catalog.get_book(user_id, book_name)
+    checkpoint = catalog.checkpoint(user_id, book_name)
+    old_pages  = catalog.page_hashes(user_id, book_name) if previous else []
+    old_count  = max([previous["chunk_count"] if previous else 0]
+                     + [i + 1 for i in (checkpoint["chunks"] if checkpoint else {})])
+    src_key    = (source["user_id"], source["book_name"])
+
+    copied  = copy_vectors(store, source, user_id, book_name, on_upsert)
+    stale   = [chunk_id(user_id, book_name, i) for i in range(copied, old_count)]
+    deleted = store.delete_batched(stale, namespace=namespace_for(user_id, book_name)) if stale else 0
+    get_chunk_store().delete(stale)
+    if not bm25.copy(*src_key, user_id, book_name):
+        bm25.remove(user_id, book_name)
+
+    page_hashes = catalog.page_hashes(*src_key)
+    catalog.record_book(user_id, book_name, copied, content_hash=source["content_hash"],
+                        size_bytes=os.path.getsize(path), page_hashes=page_hashes,
+                        chunk_hashes=catalog.chunk_hashes(*src_key))
+    changed_pages = _changed_pages(old_pages, page_hashes)
+    if echo:
+        print(f"🔗 Linked '{book_name}' for {user_id} to identical '{source['book_name']}': "
+              f"{copied} chunks copied, {deleted} deleted")
+    return {"status": "linked", "chunks": copied, "upserted": copied, "deleted": deleted,
+            "changed_pages": changed_pages}
+
+
+# === Book ingestion (full or incremental) ===
+def prepare_book(path: str) -> dict:
+    # Extraction and chunking of a PDF on their own, for ingest_book(prepared=...);
+    # picklable in and out so it can run in a worker process.
+    page_hashes: List[str] = []
+    extracting, chunking = metrics.Stopwatch(), metrics.Stopwatch()
+
+    def hashed_pages():
+        for page_no, text in extracting.iterate(iter_pages(path, workers=1)):
+            page_hashes.append(text_hash(text))
+            yield page_no, text
+
+    chunks = list(chunking.iterate(iter_chunks(hashed_pages())))
+    return {"page_hashes": page_hashes, "chunks": chunks, "extract_seconds": extracting.seconds,
+            "chunk_seconds": max(0.0, chunking.seconds - extracting.seconds)}
+
+
+def ingest_book(
+    store: VectorStore,
+    user_id: str,
+    book_name: str,
+    path: str,
+    progress: Optional[Callable[[EmbedStats], None]] = None,
+    on_upsert: Optional[Callable[[int], None]] = None,
+    content_hash: Optional[str] = None,
+    prepared: Optional[Tuple[List[str], List[object]]] = None,
+    echo: bool = True,
+) -> dict:
+    # Indexes a PDF for a user. An identical file (same SHA-256, passed in as
+    # `content_hash` when already known) is skipped, or linked from another
+    # book that has it. If a previous version is in the catalog, the
+    # new one is diffed against the page and chunk hashes stored at index time:
+    # chunks whose text is unchanged at the same position are skipped, changed
+    # ones are re-embedded (through the embedding cache) and upserted, and ids
+    # past the new chunk count are deleted.
+    # Every upserted batch is checkpointed in the catalog, so a run that fails
+    # or is killed resumes where it stopped when the same file is ingested
+    # again; the book is only recorded as indexed once all of it is stored.
+    # `prepared` is (page hashes, chunks) from prepare_book() when extraction
+    # and chunking already ran elsewhere, e.g. in a worker process.
+    catalog    = get_catalog()
+    previous   = catalog.get_book(user_id, book_name)
+    checkpoint = catalog.checkpoint(user_id, book_name)
+    digest     = content_hash or file_sha256(path)
+    if previous and previous["content_hash"] == digest and checkpoint is None:
+        return {"status": "unchanged", "chunks": previous["chunk_count"], "upserted": 0, "deleted": 0,
+                "changed_pages": []}
+    source = catalog.find_by_hash(digest, exclude=(user_id, book_name))
+    if source:
+        try:
+            return link_book(store, source, user_id, book_name, path, on_upsert, echo)
+        except LookupError as e:
+            if echo:
+                print(f"⚠️ Can't link '{book_name}' to '{source['book_name']}' ({e}); indexing it in full")
+            else:
+                logger.warning(f"Can't link '{book_name}' for {user_id} to '{source['book_name']}' ({e}); "
+                               f"indexing it in full")
+
+    old_pages  = catalog.page_hashes(user_id, book_name) if previous else []
+    old_chunks = catalog.chunk_hashes(user_id, book_name) if previous else []
+    # hash of what is stored at each position: the indexed version, overwritten
+    # by whatever an interrupted run (of this file or another one) committed
+    committed = checkpoint["chunks"] if checkpoint else {}
+    stored    = {**dict(enumerate(old_chunks)), **committed}
+    old_count = max([previous["chunk_count"] if previous else 0] + [i + 1 for i in committed])
+    catalog.start_checkpoint(user_id, book_name, digest, os.path.abspath(path))
+    resumed = 0
+
+    page_hashes: List[str] = []
+    chunk_hashes: List[str] = []
+    # extraction and chunking run interleaved with embedding; their time is
+    # accumulated here and recorded once per book
+    extracting, chunking = metrics.Stopwatch(), metrics.Stopwatch()
+
+    def hashed_pages():
+        for page_no, text in extracting.iterate(iter_pages(path)):
+            page_hashes.append(text_hash(text))
+            yield page_no, text
+
+    lexical = bm25.BM25Builder()
+    if prepared is not None:
+        page_hashes.extend(prepared[0])
+        chunks = iter(prepared[1])
+    else:
+        chunks = chunking.iterate(iter_chunks(hashed_pages()))
+
+    def changed_chunks():
+        nonlocal resumed
+        for i, chunk in enumerate(lexical.tap(chunks)):
+            # page numbers are part of the hash so shifted provenance gets rewritten too
+            h = text_hash(f"{chunk.page_start}:{chunk.page_end}:{chunk.text}")
+            chunk_hashes.append(h)
+            if stored.get(i) == h:
+                resumed += committed.get(i) == h
+                continue
+            yield i, chunk
+
+    def commit(positions: List[int]) -> None:
+        catalog.commit_chunks(user_id, book_name, [(i, chunk_hashes[i]) for i in positions])
+
+    upserted = index_chunks(store, user_id, book_name, changed_chunks(), progress, on_upsert, commit, echo)
+    stale    = [chunk_id(user_id, book_name, i) for i in range(len(chunk_hashes), old_count)]
+    deleted  = store.delete_batched(stale, namespace=namespace_for(user_id, book_name)) if stale else 0
+    get_chunk_store().delete(stale)
+
+    if prepared is None:
+        metrics.observe("extract", extracting.seconds)
+        metrics.observe("chunk", max(0.0, chunking.seconds - extracting.seconds))
+    metrics.count("pages", len(page_hashes))
+
+    lexical.save(user_id, book_name)
+    catalog.record_book(user_id, book_name, len(chunk_hashes), content_hash=digest,
+                        size_bytes=os.path.getsize(path), page_hashes=page_hashes, chunk_hashes=chunk_hashes)
+
+    changed_pages = _changed_pages(old_pages, page_hashes)
+    status = "updated" if previous else "indexed"
+    if echo:
+        print(f"📚 {status.capitalize()} '{book_name}' for {user_id}: {len(chunk_hashes)} chunks, "
+              f"{upserted} upserted, {deleted} deleted, {len(changed_pages)} changed pages"
+              + (f", {resumed} resumed from checkpoint" if resumed else ""))
+    return {"status": status, "chunks": len(chunk_hashes), "upserted": upserted, "deleted": deleted,
+            "changed_pages": changed_pages, "resumed": resumed}
@@ -0,0 +1,106 @@
+import os
+import time
+import uuid
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Optional
+
+# === Background ingestion jobs ===
+JOB_WORKERS    = int(os.getenv("JOB_WORKERS", "2"))        # books indexed at the same time
+JOB_TTL        = int(os.getenv("JOB_TTL", "3600"))         # seconds finished jobs stay queryable
+JOB_USER_LIMIT = int(os.getenv("JOB_USER_LIMIT", "4"))     # unfinished jobs one user may have at once
+
+# dedicated pool so ingestion never competes with the request threadpool / event loop
+executor = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix="ingest")
+
+FINISHED_STAGES = {"done", "skipped", "failed"}
+
+logger = logging.getLogger("uvicorn.error")
+
+
+class Job:
+    def __init__(self, user_id: str, book_name: str):
+        self.id              = uuid.uuid4().hex
+        self.user_id         = user_id
+        self.book_name       = book_name
+        self.stage           = "queued"
+        self.chunks_total    = 0
+        self.chunks_embedded = 0
+        self.chunks_upserted = 0
+        self.message         = ""
+        self.lock            = threading.Lock()
+        self.error           = None
+        self.created_at      = time.time()
+        self.updated_at      = self.created_at
+
+    def update(self, **fields) -> None:
+        for k, v in fields.items():
+            setattr(self, k, v)
+        self.updated_at = time.time()
+
+    def add_upserted(self, n: int) -> None:
+        with self.lock:
+            self.chunks_upserted += n
+        self.updated_at = time.time()
+
+    @property
+    def finished(self) -> bool:
+        return self.stage in FINISHED_STAGES
+
+    def to_dict(self) -> dict:
+        return {
+            "job_id":          self.id,
+            "user_id":         self.user_id,
+            "book_name":       self.book_name,
+            "stage":           self.stage,
+            "chunks_embedded": self.chunks_embedded,
+            "chunks_upserted": self.chunks_upserted,
+            "chunks_total":    self.chunks_total,
+            "message":         self.message,
+            "error":           self.error,
+            "created_at":      self.created_at,
+            "updated_at":      self.updated_at,
+        }
+
+
+_jobs: Dict[str, Job] = {}
+_lock = threading.Lock()
+
+
+def _prune() -> None:
+    cutoff = time.time() - JOB_TTL
+    for job_id in [j.id for j in _jobs.values() if j.finished and j.updated_at < cutoff]:
+        del _jobs[job_id]
+
+
+def submit(user_id: str, book_name: str, fn: Callable[[Job], None]) -> Job:
+    # Runs fn(job) on the ingestion pool. fn reports progress through job.update();
+    # any exception marks the job failed.
+    job = Job(user_id, book_name)
+    with _lock:
+        _prune()
+        _jobs[job.id] = job
+
+    def run() -> None:
+        try:
+            fn(job)
+            if not job.finished:
+                job.update(stage="done")
+        except Exception as e:
+            logger.error(f"Ingestion job {job.id} for '{job.book_name}' failed: {e}", exc_info=True)
+            job.update(stage="failed", error=str(e))
+
+    executor.submit(run)
+    return job
+
+
+def pending(user_id: str) -> int:
+    # the user's jobs that are queued or running
+    with _lock:
+        return sum(1 for j in _jobs.values() if j.user_id == user_id and not j.finished)
+
+
+def get(job_id: str) -> Optional[Job]:
+    with _lock:
+        return _jobs.get(job_id)
@@ -229,22 +229,67 @@
 
 #!/usr/bin/env python3
 import os
+import sys
 import time
 import argparse
 from dotenv import load_dotenv
-import fitz
 import numpy as np
-from pinecone import Pinecone, ServerlessSpec
-from pinecone.openapi_support.exceptions import PineconeApiException
-import google.generativeai as genai
+from vector_store import delete_book_vectors, get_store
+from catalog import get_catalog
+from chunk_store import get_chunk_store
+import gemini
+import bm25
+import retrieval
+import scheduler
 
 load_dotenv()
 
+# `main.py ingest-dir <dir> <user_id>`: index every PDF in a folder, then exit
+if len(sys.argv) > 1 and sys.argv[1] == "ingest-dir":
+    dir_parser = argparse.ArgumentParser(prog="main.py ingest-dir",
+                                         description="📚 Index every PDF under a directory for a user.")
+    dir_parser.add_argument("dir", help="Directory searched (recursively) for PDF files")
+    dir_parser.add_argument("user_id", help="Unique identifier for the user")
+    dir_parser.add_argument("--processes", type=int, help="Extraction processes (default INGEST_PROCESSES)")
+    dir_parser.add_argument("--books", type=int, help="Books embedded at once (default INGEST_BOOKS)")
+    dir_args = dir_parser.parse_args(sys.argv[2:])
+    if not os.path.isdir(dir_args.dir):
+        raise NotADirectoryError(f"No such directory: '{dir_args.dir}'")
+    gemini.api_key()
+
+    import bulk_ingest
+    stats = bulk_ingest.ingest_dir(get_store(), dir_args.user_id, dir_args.dir,
+                                   processes=dir_args.processes or bulk_ingest.INGEST_PROCESSES,
+                                   books=dir_args.books or bulk_ingest.INGEST_BOOKS)
+    print(stats.summary())
+    exit(1 if stats.failures else 0)
+
+# `main.py migrate-namespaces`: move vectors from the shared default namespace into per-user (or per-book) ones
+if len(sys.argv) > 1 and sys.argv[1] == "migrate-namespaces":
+    from vector_store import MIGRATE_BATCH, VECTOR_NAMESPACES, migrate_namespaces
+    migrate_parser = argparse.ArgumentParser(prog="main.py migrate-namespaces",
+                                             description="📦 Move vectors into the namespaces set by VECTOR_NAMESPACES.")
+    migrate_parser.add_argument("--from-namespace", default="", help="Namespace to move vectors out of (default: the default namespace)")
+    migrate_parser.add_argument("--batch", type=int, default=MIGRATE_BATCH, help="Vectors moved per round")
+    migrate_args = migrate_parser.parse_args(sys.argv[2:])
+    if VECTOR_NAMESPACES == "none":
+        raise SystemExit("VECTOR_NAMESPACES is 'none': set it to 'user' or 'book' to choose the namespaces to migrate to.")
+
+    started = time.monotonic()
+    moved, skipped, books = migrate_namespaces(
+        get_store(), migrate_args.from_namespace, migrate_args.batch,
+        on_batch=lambda moved, skipped: print(f"\r📦 {moved} vectors moved, {skipped} left in place", end="", flush=True))
+    get_catalog().register_books(books)
+    print(f"\n✅ Moved {moved} vectors of {len(books)} books into {VECTOR_NAMESPACES} namespaces "
+          f"in {time.monotonic() - started:.1f}s ({skipped} left in place).")
+    exit(0)
+
 parser = argparse.ArgumentParser(description="📚 Gemini‑Book‑Bot: Ask questions about your PDF book.")
 parser.add_argument("pdf_path", help="Path to the PDF file you want to index and query")
 parser.add_argument("user_id", help="Unique identifier for the user")
 parser.add_argument("action", nargs='?', default="query", choices=["query", "delete"], help="Action to perform")
 parser.add_argument("--list-books", action="store_true", help="List all books already indexed for the given user")
+parser.add_argument("--questions-file", help="Answer every question in this file (one per line) instead of prompting")
 args = parser.parse_args()
 
 PDF_PATH = args.pdf_path
@@ -255,76 +300,38 @@ ACTION = args.action
 if not os.path.isfile(PDF_PATH):
     raise FileNotFoundError(f"No such file: '{PDF_PATH}'")
 
-GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-if not GEMINI_API_KEY:
-    raise RuntimeError("GEMINI_API_KEY not set in .env")
-genai.configure(api_key=GEMINI_API_KEY)
-model = genai.GenerativeModel("models/gemini-1.5-pro-001")
-
-PINECONE_API_KEY   = os.getenv("PINECONE_API_KEY")
-PINECONE_ENV       = os.getenv("PINECONE_ENVIRONMENT")
-PINECONE_CLOUD     = os.getenv("PINECONE_CLOUD")
-PINECONE_REGION    = os.getenv("PINECONE_REGION")
-
-if not (PINECONE_API_KEY and PINECONE_ENV and PINECONE_CLOUD and PINECONE_REGION):
-    raise RuntimeError("PINECONE settings missing in .env")
-
-pc = Pinecone(api_key=PINECONE_API_KEY, environment=PINECONE_ENV)
-index_name = "book-index"
-dimension  = 768
-
-try:
-    if index_name not in pc.list_indexes():
-        pc.create_index(
-            name=index_name,
-            vector_type="dense",
-            dimension=dimension,
-            metric="cosine",
-            spec=ServerlessSpec(cloud=PINECONE_CLOUD, region=PINECONE_REGION),
-            deletion_protection="disabled"
-        )
-except PineconeApiException as e:
-    if getattr(e, 'status', None) == 409:
-        print(f"Index '{index_name}' already exists.")
-    else:
-        raise
+# the Gemini client and the vector index connection are set up on first use, so
+# --list-books and delete never import the Gemini SDK or parse a PDF
+gemini.api_key()
 
-index = pc.Index(index_name)
-
-def book_already_indexed(user_id: str, book_name: str) -> bool:
-    results = index.query(
-        vector=[0.0] * dimension,
-        top_k=1,
-        include_metadata=True,
-        filter={"user_id": user_id, "book_name": book_name}
-    )
-    return len(results.get("matches", [])) > 0
+index = get_store()
 
-def extract_text_from_pdf(pdf_path: str) -> str:
-    doc = fitz.open(pdf_path)
-    return "\n".join(page.get_text() for page in doc)
+catalog = get_catalog()
 
-def chunk_text(text: str, chunk_size: int = 300) -> list[str]:
-    return [text[i: i + chunk_size] for i in range(0, len(text), chunk_size)]
-
-def get_embedding(text: str) -> np.ndarray:
-    resp = genai.embed_content(
-        model="models/embedding-001",
-        content=text,
-        task_type="retrieval_document",
-        title="book content"
-    )
+def book_already_indexed(user_id: str, book_name: str) -> bool:
+    catalog.ensure_user(user_id, index)
+    return catalog.get_book(user_id, book_name) is not None
+
+def get_embedding(text: str, priority: str = scheduler.INTERACTIVE) -> np.ndarray:
+    with scheduler.get_scheduler().slot(USER_ID, priority, reject=False):
+        resp = gemini.client().embed_content(
+            model="models/embedding-001",
+            content=text,
+            task_type="retrieval_document",
+            title="book content"
+        )
     return np.array(resp["embedding"])
 
 def list_books_for_user(user_id: str) -> list[str]:
-    response = index.query(
-        vector=[0.0] * dimension,
-        top_k=100,
-        include_metadata=True,
-        filter={"user_id": user_id}
-    )
-    books = {match["metadata"]["book_name"] for match in response.get("matches", [])}
-    return sorted(books)
+    catalog.ensure_user(user_id, index)
+    return catalog.list_books(user_id)
+
+def delete_chunks(user_id: str, book_name: str) -> tuple[int, float]:
+    deleted, seconds = delete_book_vectors(index, user_id, book_name, catalog.chunk_extent(user_id, book_name))
+    catalog.remove_book(user_id, book_name)
+    get_chunk_store().delete_book(user_id, book_name)
+    bm25.remove(user_id, book_name)
+    return deleted, seconds
 
 if args.list_books:
     books = list_books_for_user(USER_ID)
@@ -336,73 +343,72 @@ if args.list_books:
         print("No books indexed yet.")
     exit(0)
 
-if not book_already_indexed(USER_ID, BOOK_NAME):
-    print(f"🔍 Indexing new book: '{BOOK_NAME}' for user '{USER_ID}'")
-    pdf_text    = extract_text_from_pdf(PDF_PATH)
-    book_chunks = chunk_text(pdf_text)
-
-    vectors = []
-    for i, chunk in enumerate(book_chunks):
-        print(f"Embedding chunk {i+1}/{len(book_chunks)}")
-        emb = get_embedding(chunk)
-        vectors.append({
-            "id":       f"{USER_ID}-{BOOK_NAME}-chunk-{i}",
-            "values":   emb.tolist(),
-            "metadata": {
-                "user_id": USER_ID,
-                "book_name": BOOK_NAME,
-                "text": chunk
-            }
-        })
-        time.sleep(0.3)
-
-    BATCH_SIZE = 50
-    for i in range(0, len(vectors), BATCH_SIZE):
-        batch = vectors[i:i+BATCH_SIZE]
-        index.upsert(vectors=batch)
+if ACTION == "delete":
+    deleted, seconds = delete_chunks(USER_ID, BOOK_NAME)
+    if deleted:
+        print(f"✅ Deleted {deleted} chunks for book '{BOOK_NAME}' and user '{USER_ID}' in {seconds:.2f}s.")
+    else:
+        print(f"⚠ No chunks found for book '{BOOK_NAME}' and user '{USER_ID}'.")
+    exit(0)
+
+# PDF parsing and the embedding pipeline are only imported when a book is indexed
+from ingest import ingest_book
+
+# new books are indexed in full; known ones only re-index the pages that changed
+if book_already_indexed(USER_ID, BOOK_NAME):
+    print(f"🔁 Book '{BOOK_NAME}' is indexed for user '{USER_ID}'; checking it for changes")
 else:
-    print(f"✅ Book '{BOOK_NAME}' already indexed for user '{USER_ID}'.")
-
-def query_pinecone(query: str, top_k: int = 1) -> list[dict]:
-    q_emb = get_embedding(query)
-    results = index.query(
-        vector=q_emb.tolist(),
-        top_k=top_k,
-        include_metadata=True,
-        filter={"user_id": USER_ID, "book_name": BOOK_NAME}
-    )
-    return results.get("matches", [])
-
-def delete_chunks(user_id: str, book_name: str) -> bool:
-    results = index.query(
-        vector=[0.0] * dimension,
-        top_k=1000,
-        include_metadata=False,
-        filter={"user_id": user_id, "book_name": book_name}
-    )
-    ids_to_delete = [match["id"] for match in results.get("matches", [])]
-    if not ids_to_delete:
-        return False
-    index.delete(ids=ids_to_delete)
-    return True
+    print(f"🔍 Indexing new book: '{BOOK_NAME}' for user '{USER_ID}'")
+result = ingest_book(index, USER_ID, BOOK_NAME, PDF_PATH)
+if result["status"] == "unchanged":
+    print(f"✅ Book '{BOOK_NAME}' is unchanged, nothing to re-index.")
+
+
+def query_pinecone(query: str, top_k: int = retrieval.CONTEXT_CHUNKS) -> list[dict]:
+    # hybrid BM25 + dense retrieval; keyword lookups are answered without an embedding call
+    return retrieval.search(index, USER_ID, BOOK_NAME, query,
+                            embed=lambda q: get_embedding(q).tolist(), top_k=top_k)
 
-def ask_gemini(_query: str, context: str) -> str:
+def ask_gemini(_query: str, context: str, priority: str = scheduler.INTERACTIVE) -> str:
     prompt = (
         "You are a helpful assistant tasked with rewriting book excerpts in a clearer and more formal tone.\n\n"
         f"*User's Question:*\n{_query}\n\n"
         f"*Relevant Excerpt from the Book:*\n{context}\n\n"
         "➡ Please rephrase the excerpt to directly address the user's question."
     )
-    response = model.generate_content(prompt)
+    with scheduler.get_scheduler().slot(USER_ID, priority, reject=False):
+        response = gemini.model().generate_content(prompt)
     return response.text
 
-if __name__ == "__main__":
-    if ACTION == "delete":
-        success = delete_chunks(USER_ID, BOOK_NAME)
-        if success:
-            print(f"✅ Deleted all chunks for book '{BOOK_NAME}' and user '{USER_ID}'.")
+def answer_questions_file(path: str) -> None:
+    # embeds all questions in batched calls, retrieves concurrently and generates
+    # through a bounded pool; answers are printed in file order as they complete
+    import batch_qa
+
+    with open(path, encoding="utf-8") as f:
+        queries = [line.strip() for line in f if line.strip()]
+    print(f"\n📚 Answering {len(queries)} questions about '{BOOK_NAME}' for user '{USER_ID}'")
+    started, failed = time.perf_counter(), 0
+    results = batch_qa.answer_batch(index, USER_ID, BOOK_NAME, queries,
+                                    generate=lambda q, matches: ask_gemini(q, retrieval.context_text(matches), scheduler.BULK),
+                                    embed=lambda q: get_embedding(q, scheduler.BULK).tolist())
+    for r in results:
+        t = r["timings"]
+        print(f"\n[{r['index'] + 1}/{len(queries)}] ❓ {r['query']}")
+        if "error" in r:
+            failed += 1
+            print(f"⚠ {r['error']}")
         else:
-            print(f"⚠ No chunks found for book '{BOOK_NAME}' and user '{USER_ID}'.")
+            print(f"🖋 {r['answer'].strip()}")
+        print(f"   ⏱ embed {t['embed_ms']} ms, retrieve {t['retrieve_ms']} ms, "
+              f"generate {t.get('generate_ms', 0)} ms, done at {t['total_ms']} ms")
+    elapsed = time.perf_counter() - started
+    print(f"\n✅ {len(queries) - failed}/{len(queries)} answered in {elapsed:.1f}s "
+          f"({len(queries) / elapsed if elapsed else 0:.1f} questions/sec)")
+
+if __name__ == "__main__":
+    if args.questions_file:
+        answer_questions_file(args.questions_file)
         exit(0)
 
     print(f"\n📚 Ready! Book: '{BOOK_NAME}' for user: '{USER_ID}'\nEnter a keyword or phrase to query (type 'exit' to quit).")
@@ -416,6 +422,6 @@ if __name__ == "__main__":
             print("No relevant content found.")
             continue
 
-        best = matches[0]["metadata"]["text"]
+        best = retrieval.context_text(matches)
         paraphrase = ask_gemini(q, best)
         print("\n🖋 Gemini’s Paraphrase:\n", paraphrase)
@@ -0,0 +1,151 @@
+import time
+import asyncio
+import threading
+import contextvars
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+# === Timing spans and Prometheus metrics ===
+# Stage latencies are kept as cumulative histograms labeled by stage and outcome
+# and rendered in the Prometheus text format by GET /metrics. Spans opened while
+# a request is being served are also collected for its Server-Timing header.
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def _labels(labels: Labels, extra: str = "") -> str:
+    parts = [f'{k}="{v}"' for k, v in labels] + ([extra] if extra else [])
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Counter:
+    def __init__(self, name: str, help: str):
+        self.name   = name
+        self.help   = help
+        self.values: Dict[Labels, float] = {}
+        self.lock   = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            self.values[key] = self.values.get(key, 0.0) + amount
+
+    def render(self) -> List[str]:
+        with self.lock:
+            values = dict(self.values)
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        lines += [f"{self.name}{_labels(k)} {v:g}" for k, v in sorted(values.items())]
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, buckets: Tuple[float, ...] = BUCKETS):
+        self.name    = name
+        self.help    = help
+        self.buckets = buckets
+        self.values: Dict[Labels, list] = {}      # labels -> [bucket counts..., sum, count]
+        self.lock    = threading.Lock()
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            row = self.values.setdefault(key, [0] * len(self.buckets) + [0.0, 0])
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    row[i] += 1
+            row[-2] += value
+            row[-1] += 1
+
+    def render(self) -> List[str]:
+        with self.lock:
+            values = {k: list(v) for k, v in self.values.items()}
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for key, row in sorted(values.items()):
+            for bound, n in zip(self.buckets, row):
+                le = 'le="%g"' % bound
+                lines.append(f"{self.name}_bucket{_labels(key, le)} {n}")
+            le = 'le="+Inf"'
+            lines.append(f"{self.name}_bucket{_labels(key, le)} {row[-1]}")
+            lines.append(f"{self.name}_sum{_labels(key)} {row[-2]:.6f}")
+            lines.append(f"{self.name}_count{_labels(key)} {row[-1]}")
+        return lines
+
+
+stage_seconds   = Histogram("bookbot_stage_seconds", "Time spent in a pipeline stage.")
+items_total     = Counter("bookbot_items_total", "Pages, chunks and vectors processed, by kind.")
+request_seconds = Histogram("bookbot_http_request_seconds", "HTTP request latency by route and status.")
+REGISTRY = [stage_seconds, items_total, request_seconds]
+
+# spans of the request being served, when timing headers are enabled
+_request_spans: contextvars.ContextVar[Optional[List[Tuple[str, float]]]] = \
+    contextvars.ContextVar("request_spans", default=None)
+
+
+def observe(stage: str, seconds: float, outcome: str = "ok") -> None:
+    stage_seconds.observe(seconds, stage=stage, outcome=outcome)
+    spans = _request_spans.get()
+    if spans is not None:
+        spans.append((stage, seconds))
+
+
+def count(kind: str, n: int = 1) -> None:
+    if n:
+        items_total.inc(n, kind=kind)
+
+
+@contextmanager
+def span(stage: str) -> Iterator[None]:
+    # times the block; an exception marks the outcome "error", closing a
+    # generator early or cancelling a task (client went away) marks it "cancelled"
+    t0, outcome = time.perf_counter(), "ok"
+    try:
+        yield
+    except (GeneratorExit, asyncio.CancelledError):
+        outcome = "cancelled"
+        raise
+    except BaseException:
+        outcome = "error"
+        raise
+    finally:
+        observe(stage, time.perf_counter() - t0, outcome)
+
+
+class Stopwatch:
+    # accumulates the time spent producing items of an iterator, for stages that
+    # run interleaved in a streaming pipeline
+    def __init__(self):
+        self.seconds = 0.0
+
+    def iterate(self, items: Iterable) -> Iterator:
+        it = iter(items)
+        while True:
+            t0 = time.perf_counter()
+            try:
+                item = next(it)
+            except StopIteration:
+                return
+            finally:
+                self.seconds += time.perf_counter() - t0
+            yield item
+
+
+def start_request() -> contextvars.Token:
+    return _request_spans.set([])
+
+
+def request_timing() -> str:
+    # Server-Timing header value: total time per stage so far in this request
+    spans = _request_spans.get() or []
+    totals: Dict[str, float] = {}
+    for stage, seconds in spans:
+        totals[stage] = totals.get(stage, 0.0) + seconds
+    return ", ".join(f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in totals.items())
+
+
+def finish_request(token: contextvars.Token) -> None:
+    _request_spans.reset(token)
+
+
+def render() -> str:
+    return "\n".join(line for metric in REGISTRY for line in metric.render()) + "\n"
@@ -0,0 +1,51 @@
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator, List, Tuple
+
+# === Streaming PDF extraction ===
+PDF_WORKERS        = int(os.getenv("PDF_WORKERS", "1"))        # >1 parses page ranges in a process pool
+PDF_PAGES_PER_TASK = int(os.getenv("PDF_PAGES_PER_TASK", "16"))
+# PyMuPDF (fitz) is imported inside the functions so importing this module stays
+# cheap for commands that never open a PDF
+
+
+def page_count(path: str) -> int:
+    import fitz
+    with fitz.open(path) as doc:
+        return doc.page_count
+
+
+def _extract_range(path: str, start: int, stop: int) -> List[Tuple[int, str]]:
+    # runs in a worker process: each worker opens its own document handle
+    import fitz
+    with fitz.open(path) as doc:
+        return [(i, doc[i].get_text()) for i in range(start, stop)]
+
+
+def iter_pages(path: str, workers: int = PDF_WORKERS,
+               pages_per_task: int = PDF_PAGES_PER_TASK) -> Iterator[Tuple[int, str]]:
+    # Yields (page_number, text) in page order, one page at a time, so callers
+    # can start chunking/embedding before the whole document is parsed.
+    if workers <= 1:
+        import fitz
+        with fitz.open(path) as doc:
+            for i, page in enumerate(doc):
+                yield i, page.get_text()
+        return
+
+    n = page_count(path)
+    ranges = iter([(s, min(s + pages_per_task, n)) for s in range(0, n, pages_per_task)])
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        # keep a bounded number of ranges in flight and hand them back in order
+        inflight = deque()
+        for start, stop in ranges:
+            inflight.append(pool.submit(_extract_range, path, start, stop))
+            if len(inflight) >= 2 * workers:
+                break
+        while inflight:
+            pages = inflight.popleft().result()
+            nxt = next(ranges, None)
+            if nxt is not None:
+                inflight.append(pool.submit(_extract_range, path, *nxt))
+            yield from pages
@@ -0,0 +1,76 @@
+import os
+import re
+import time
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional
+
+# === Question-path caches ===
+QUERY_CACHE_SIZE  = int(os.getenv("QUERY_CACHE_SIZE", "10000"))
+QUERY_CACHE_TTL   = float(os.getenv("QUERY_CACHE_TTL", "86400"))    # embeddings never go stale, keep a day
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "5000"))
+ANSWER_CACHE_TTL  = float(os.getenv("ANSWER_CACHE_TTL", "3600"))
+
+
+class TTLCache:
+    # Thread-safe LRU cache whose entries also expire `ttl` seconds after insertion.
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl     = ttl
+        self.data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self.lock    = threading.Lock()
+        self.hits    = 0
+        self.misses  = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self.lock:
+            item = self.data.get(key)
+            if item is None or item[0] < time.monotonic():
+                if item is not None:
+                    del self.data[key]
+                self.misses += 1
+                return None
+            self.data.move_to_end(key)
+            self.hits += 1
+            return item[1]
+
+    def put(self, key: Hashable, value: Any) -> None:
+        with self.lock:
+            self.data[key] = (time.monotonic() + self.ttl, value)
+            self.data.move_to_end(key)
+            while len(self.data) > self.maxsize:
+                self.data.popitem(last=False)
+
+    def discard_where(self, predicate: Callable[[Hashable], bool]) -> int:
+        with self.lock:
+            doomed = [k for k in self.data if predicate(k)]
+            for k in doomed:
+                del self.data[k]
+            return len(doomed)
+
+    def stats(self) -> dict:
+        with self.lock:
+            total = self.hits + self.misses
+            return {
+                "size":     len(self.data),
+                "maxsize":  self.maxsize,
+                "ttl":      self.ttl,
+                "hits":     self.hits,
+                "misses":   self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+            }
+
+
+def normalize_query(query: str) -> str:
+    return re.sub(r"\s+", " ", query).strip().lower()
+
+
+# level 1: normalized query text -> query embedding
+query_embeddings = TTLCache(QUERY_CACHE_SIZE, QUERY_CACHE_TTL)
+
+# level 2: (user_id, book_name, top chunk ids, normalized query) -> generated answer
+answers = TTLCache(ANSWER_CACHE_SIZE, ANSWER_CACHE_TTL)
+
+
+def invalidate_book(user_id: str, book_name: str) -> int:
+    return answers.discard_where(lambda k: k[0] == user_id and k[1] == book_name)
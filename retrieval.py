@@ -0,0 +1,211 @@
+import os
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+import bm25
+import metrics
+from chunk_store import get_chunk_store
+from chunker import count_tokens
+from vector_store import DIMENSION, Match, VectorStore, chunk_id, chunk_index, namespace_for
+
+# === Hybrid lexical + vector retrieval ===
+RETRIEVAL_CANDIDATES = int(os.getenv("RETRIEVAL_CANDIDATES", "20"))   # hits taken from each retriever
+CONTEXT_CHUNKS       = int(os.getenv("CONTEXT_CHUNKS", "3"))          # diverse hits picked by MMR
+CONTEXT_NEIGHBORS    = int(os.getenv("CONTEXT_NEIGHBORS", "1"))       # adjacent chunks added on each side of a hit
+CONTEXT_TOKENS       = int(os.getenv("CONTEXT_TOKENS", "800"))        # word budget of the context sent to Gemini
+MMR_LAMBDA           = float(os.getenv("MMR_LAMBDA", "0.7"))          # 1.0 ranks on relevance alone
+DUPLICATE_SIMILARITY = 0.95                                           # cosine above which a candidate is dropped
+RRF_K                = 60
+# queries of at most this many terms are treated as keyword lookups and answered
+# from BM25 alone, without embedding the query; 0 disables the fast path
+LEXICAL_MAX_TERMS    = int(os.getenv("LEXICAL_MAX_TERMS", "3"))
+
+MODES = ("auto", "hybrid", "vector", "lexical")
+
+
+def rrf_scores(*rankings: List[str], k: int = RRF_K) -> Dict[str, float]:
+    # reciprocal rank fusion: sum of 1 / (k + rank) over every ranking an id appears in
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, id_ in enumerate(ranking):
+            scores[id_] = scores.get(id_, 0.0) + 1.0 / (k + rank + 1)
+    return scores
+
+
+def is_keyword(query: str) -> bool:
+    # short queries are keyword lookups, answered from BM25 alone in "auto" mode
+    return 0 < len(bm25.tokenize(query)) <= LEXICAL_MAX_TERMS
+
+
+def lexical_ids(user_id: str, book_name: str, query: str, top_k: int) -> List[str]:
+    idx = bm25.load(user_id, book_name)
+    if idx is None:
+        return []
+    return [chunk_id(user_id, book_name, i) for i, _ in idx.search(query, top_k)]
+
+
+def mmr(relevance: np.ndarray, vectors: np.ndarray, k: int, lam: float = MMR_LAMBDA,
+        duplicate: float = DUPLICATE_SIMILARITY) -> List[int]:
+    # Maximal Marginal Relevance over n candidates: repeatedly picks the one that
+    # maximizes lam * relevance - (1 - lam) * (max cosine to those already picked).
+    # Candidates nearly identical to a pick are dropped outright. One (n, n)
+    # similarity matrix, then O(n) vector ops per pick.
+    n = len(relevance)
+    if not n:
+        return []
+    spread = relevance.max() - relevance.min()
+    rel    = (relevance - relevance.min()) / spread if spread > 0 else np.ones(n)
+    norms  = np.linalg.norm(vectors, axis=1, keepdims=True)
+    unit   = vectors / np.where(norms == 0, 1, norms)
+    sim    = unit @ unit.T
+
+    picked: List[int] = []
+    open_   = np.ones(n, dtype=bool)
+    max_sim = np.zeros(n)
+    while open_.any() and len(picked) < k:
+        score = lam * rel - (1 - lam) * max_sim if picked else rel
+        i = int(np.argmax(np.where(open_, score, -np.inf)))
+        max_sim = np.maximum(max_sim, sim[:, i]) if picked else sim[:, i]
+        picked.append(i)
+        open_[i] = False
+        open_ &= sim[:, i] < duplicate
+    return picked
+
+
+def search(
+    store: VectorStore,
+    user_id: str,
+    book_name: str,
+    query: str,
+    embed: Callable[[str], List[float]],
+    top_k: int = CONTEXT_CHUNKS,
+    mode: str = "auto",
+    candidates: int = RETRIEVAL_CANDIDATES,
+    neighbors: int = CONTEXT_NEIGHBORS,
+    budget: int = CONTEXT_TOKENS,
+) -> List[Match]:
+    # Context chunks for the query, in book order. Candidates from BM25 and/or
+    # the vector index are fused, `top_k` diverse hits are picked with MMR, each
+    # hit is expanded with its adjacent chunks and the result is packed into a
+    # `budget`-word context. `embed` is only called when dense retrieval runs, so
+    # keyword lookups never hit the embedding API.
+    if mode not in MODES:
+        raise ValueError(f"Unknown retrieval mode '{mode}'")
+    filter = {"user_id": user_id, "book_name": book_name}
+    namespace = namespace_for(user_id, book_name)
+
+    lexical: List[str] = []
+    dense:   List[Match] = []
+    if mode in ("auto", "hybrid", "lexical"):
+        with metrics.span("lexical_query"):
+            lexical = lexical_ids(user_id, book_name, query, candidates)
+    if not (lexical and (mode == "lexical" or (mode == "auto" and is_keyword(query)))):
+        vector = embed(query)
+        with metrics.span("vector_query"):
+            dense = store.query(vector=vector, top_k=candidates, include_metadata=True,
+                                include_values=True, filter=filter, namespace=namespace)
+
+    # relevance: the fused rank when both retrievers ran, else cosine or BM25 order
+    if dense and lexical:
+        scores = rrf_scores([m.id for m in dense], lexical)
+    elif dense:
+        scores = {m.id: m.score for m in dense}
+    else:
+        scores = rrf_scores(lexical)
+    ranked = sorted(scores, key=lambda id_: -scores[id_])
+
+    by_id = {m.id: m for m in dense}
+    missing = [id_ for id_ in ranked if id_ not in by_id]
+    if missing:
+        with metrics.span("vector_fetch"):
+            by_id.update(store.fetch(missing, include_values=True, namespace=namespace))
+    pool = [by_id[id_] for id_ in ranked if id_ in by_id]
+    if not pool:
+        return []
+
+    with metrics.span("mmr"):
+        vectors = np.asarray([m.values if m.values is not None else np.zeros(DIMENSION) for m in pool],
+                             dtype=np.float32)
+        hits = [pool[i] for i in mmr(np.asarray([scores[m.id] for m in pool]), vectors, top_k)]
+    for m in pool:
+        m.values = None                         # not needed past this point
+    return pack(expand(store, hits, neighbors, by_id, namespace), budget)
+
+
+def expand(store: VectorStore, hits: List[Match], neighbors: int,
+           known: Optional[Dict[str, Match]] = None, namespace: str = "") -> List[Match]:
+    # Hits followed by their chunk-{i±d} neighbors (d up to `neighbors`), in
+    # priority order: each hit, then its nearest neighbors. Neighbors not already
+    # retrieved are fetched in one batched call; ids past the end of the book
+    # simply don't come back.
+    known = dict(known or {})
+    wanted: List[str] = []
+    for m in hits:
+        wanted.append(m.id)
+        known[m.id] = m
+        i = chunk_index(m.id)
+        if i is None:
+            continue
+        prefix = m.id[:len(m.id) - len(str(i))]
+        for d in range(1, neighbors + 1):
+            wanted += [f"{prefix}{j}" for j in (i - d, i + d) if j >= 0]
+    wanted = list(dict.fromkeys(wanted))
+    missing = [id_ for id_ in wanted if id_ not in known]
+    if missing:
+        with metrics.span("vector_fetch"):
+            known.update(store.fetch(missing, namespace=namespace))
+    return [known[id_] for id_ in wanted if id_ in known]
+
+
+def pack(matches: List[Match], budget: int) -> List[Match]:
+    # Takes matches in priority order while their text fits in `budget` words
+    # (the first always does) and returns them in book order. Texts are kept on
+    # the match metadata so building the prompt needs no second read.
+    texts = chunk_texts(matches)
+    packed, used = [], 0
+    for m in matches:
+        cost = count_tokens(texts[m.id])
+        if packed and used + cost > budget:
+            continue
+        m.metadata["text"] = texts[m.id]
+        packed.append(m)
+        used += cost
+    return sorted(packed, key=lambda m: (chunk_index(m.id) is None, chunk_index(m.id) or 0))
+
+
+def chunk_texts(matches: List[Match]) -> Dict[str, str]:
+    # text of every match: from the metadata when already there (packed matches,
+    # vectors indexed before the chunk store), else from the chunk store in one read
+    texts = {m.id: m.metadata["text"] for m in matches if "text" in m.metadata}
+    missing = [m.id for m in matches if m.id not in texts]
+    if missing:
+        with metrics.span("chunk_text"):
+            texts.update(get_chunk_store().get_many(missing))
+    for m in matches:
+        texts.setdefault(m.id, "")
+    return texts
+
+
+def context_text(matches: List[Match], limit: Optional[int] = None) -> str:
+    # Consecutive chunks are merged into one passage without the overlap they
+    # share (located with their char offsets and checked against the text);
+    # passages are separated by blank lines.
+    matches = matches[:limit]
+    texts = chunk_texts(matches)
+    passages: List[str] = []
+    prev: Optional[Match] = None
+    for m in matches:
+        text = texts[m.id]
+        i, j = chunk_index(m.id), chunk_index(prev.id) if prev is not None else None
+        if i is not None and j is not None and i == j + 1:
+            start, end = m.metadata.get("char_start"), prev.metadata.get("char_end")
+            overlap = end - start if start is not None and end is not None else 0
+            if 0 < overlap <= len(text) and texts[prev.id].endswith(text[:overlap]):
+                passages[-1] += text[overlap:]
+            else:
+                passages[-1] += " " + text
+        else:
+            passages.append(text)
+        prev = m
+    return "\n\n".join(passages)
@@ -0,0 +1,221 @@
+import os
+import math
+import heapq
+import asyncio
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from typing import AsyncIterator, Callable, Dict, Iterator, List, Optional, Tuple
+
+import metrics
+
+# === Fair scheduling of outbound Gemini calls ===
+# Every embedding and generation call takes a slot here first. At most
+# GEMINI_CONCURRENCY calls are in flight per process, and bulk work
+# (ingestion, batch questions) may hold at most GEMINI_BULK_SHARE of them, so
+# interactive questions always find room. Waiting calls are dispatched
+# interactive first, then by weighted fair queueing across users within a
+# class: each call gets a virtual finish time of max(now, user's last finish) +
+# cost / weight, and the earliest goes next. A user flooding the queue only
+# delays their own calls. Interactive callers are refused with Overloaded (HTTP 429)
+# once the user has GEMINI_USER_QUEUE calls waiting or GEMINI_MAX_QUEUE are
+# waiting in total; bulk callers wait instead.
+GEMINI_CONCURRENCY = int(os.getenv("GEMINI_CONCURRENCY", "16"))
+GEMINI_BULK_SHARE  = float(os.getenv("GEMINI_BULK_SHARE", "0.75"))
+GEMINI_USER_QUEUE  = int(os.getenv("GEMINI_USER_QUEUE", "8"))       # waiting interactive calls per user
+GEMINI_MAX_QUEUE   = int(os.getenv("GEMINI_MAX_QUEUE", "256"))      # waiting interactive calls in total
+# per-user weights, e.g. "alice@example.com=2,batch-bot=0.5"; everyone else weighs 1
+GEMINI_USER_WEIGHTS = {
+    user.strip(): float(weight)
+    for user, _, weight in (item.rpartition("=") for item in os.getenv("GEMINI_USER_WEIGHTS", "").split(","))
+    if user.strip()
+}
+
+INTERACTIVE = "interactive"
+BULK        = "bulk"
+PRIORITIES  = (INTERACTIVE, BULK)           # dispatch order
+
+
+class Overloaded(Exception):
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class Lease:
+    # One queued or running call. `wake` is called (under the scheduler lock)
+    # when it is granted a slot.
+    def __init__(self, scheduler: "Scheduler", user_id: str, priority: str, wake: Callable[[], None]):
+        self.scheduler = scheduler
+        self.user_id   = user_id
+        self.priority  = priority
+        self.wake      = wake
+        self.granted   = False
+        self.done      = False
+        self.queued_at = time.monotonic()
+        self.started   = 0.0
+
+    def release(self) -> None:
+        # gives the slot back (or leaves the queue); safe to call more than once
+        self.scheduler._release(self)
+
+
+class Scheduler:
+    def __init__(self, concurrency: int = GEMINI_CONCURRENCY, bulk_share: float = GEMINI_BULK_SHARE,
+                 user_queue: int = GEMINI_USER_QUEUE, max_queue: int = GEMINI_MAX_QUEUE,
+                 weights: Optional[Dict[str, float]] = None):
+        self.concurrency = concurrency
+        self.bulk_limit  = max(1, min(concurrency, int(concurrency * bulk_share)))
+        self.user_queue  = user_queue
+        self.max_queue   = max_queue
+        self.weights     = GEMINI_USER_WEIGHTS if weights is None else weights
+        self.lock        = threading.Lock()
+        self.running     = {p: 0 for p in PRIORITIES}
+        self.queues: Dict[str, List[Tuple[float, int, Lease]]] = {p: [] for p in PRIORITIES}
+        self.waiting: Dict[Tuple[str, str], int] = {}         # (priority, user) -> queued leases
+        self.finish: Dict[Tuple[str, str], float] = {}        # (priority, user) -> last virtual finish time
+        self.vtime       = {p: 0.0 for p in PRIORITIES}       # virtual time: finish tag of the last dispatch
+        self.seq         = 0
+        self.hold        = 1.0                                 # moving average of seconds a slot is held
+
+    # --- bookkeeping, all under self.lock ---
+    def _queued(self, priority: str) -> int:
+        return sum(n for (p, _), n in self.waiting.items() if p == priority)
+
+    def _retry_after(self, ahead: int) -> int:
+        # rough wait for `ahead` queued calls to drain through the slots
+        return max(1, math.ceil(self.hold * (ahead + 1) / self.concurrency))
+
+    def _enqueue(self, lease: Lease, cost: float, reject: bool) -> None:
+        key = (lease.priority, lease.user_id)
+        if reject:
+            mine, total = self.waiting.get(key, 0), self._queued(lease.priority)
+            if mine >= self.user_queue or total >= self.max_queue:
+                metrics.count(f"rejected_{lease.priority}")
+                raise Overloaded(f"Too many {lease.priority} Gemini calls queued"
+                                 f"{' for this user' if mine >= self.user_queue else ''}.",
+                                 self._retry_after(total))
+        start = max(self.vtime[lease.priority], self.finish.get(key, 0.0))
+        tag   = start + cost / self.weights.get(lease.user_id, 1.0)
+        self.finish[key]  = tag
+        self.waiting[key] = self.waiting.get(key, 0) + 1
+        self.seq += 1
+        heapq.heappush(self.queues[lease.priority], (tag, self.seq, lease))
+        self._dispatch()
+
+    def _has_room(self, priority: str) -> bool:
+        if sum(self.running.values()) >= self.concurrency:
+            return False
+        return priority == INTERACTIVE or self.running[BULK] < self.bulk_limit
+
+    def _dispatch(self) -> None:
+        for priority in PRIORITIES:
+            queue = self.queues[priority]
+            while queue and self._has_room(priority):
+                tag, _, lease = heapq.heappop(queue)
+                if lease.done:                  # left the queue (cancelled) before its turn
+                    continue
+                self._unqueue(lease)
+                self.vtime[priority] = tag
+                lease.granted = True
+                lease.started = time.monotonic()
+                self.running[priority] += 1
+                metrics.observe(f"queue_{priority}", lease.started - lease.queued_at)
+                lease.wake()
+
+    def _unqueue(self, lease: Lease) -> None:
+        key = (lease.priority, lease.user_id)
+        self.waiting[key] -= 1
+        if not self.waiting[key]:
+            # an idle user starts over from the current virtual time
+            del self.waiting[key]
+            del self.finish[key]
+
+    def _release(self, lease: Lease) -> None:
+        with self.lock:
+            if lease.done:
+                return
+            lease.done = True
+            if lease.granted:
+                self.running[lease.priority] -= 1
+                self.hold = 0.9 * self.hold + 0.1 * (time.monotonic() - lease.started)
+            else:
+                self._unqueue(lease)
+            self._dispatch()
+
+    # --- public API ---
+    def acquire(self, user_id: str, priority: str = INTERACTIVE, cost: float = 1.0,
+                reject: Optional[bool] = None) -> Lease:
+        # Blocks the calling thread until a slot is granted. Raises Overloaded if
+        # `reject` (by default: interactive calls) and the queue is full.
+        ready = threading.Event()
+        lease = Lease(self, user_id, priority, ready.set)
+        with self.lock:
+            self._enqueue(lease, cost, priority == INTERACTIVE if reject is None else reject)
+        try:
+            ready.wait()
+        except BaseException:
+            lease.release()
+            raise
+        return lease
+
+    async def acquire_async(self, user_id: str, priority: str = INTERACTIVE, cost: float = 1.0,
+                            reject: Optional[bool] = None) -> Lease:
+        # acquire() for coroutines: waits without blocking the event loop, and
+        # leaves the queue if the waiting task is cancelled
+        loop  = asyncio.get_running_loop()
+        ready = loop.create_future()
+
+        def wake() -> None:
+            loop.call_soon_threadsafe(lambda: ready.done() or ready.set_result(None))
+
+        lease = Lease(self, user_id, priority, wake)
+        with self.lock:
+            self._enqueue(lease, cost, priority == INTERACTIVE if reject is None else reject)
+        try:
+            await ready
+        except BaseException:
+            lease.release()
+            raise
+        return lease
+
+    @contextmanager
+    def slot(self, user_id: str, priority: str = INTERACTIVE, cost: float = 1.0,
+             reject: Optional[bool] = None) -> Iterator[Lease]:
+        lease = self.acquire(user_id, priority, cost, reject)
+        try:
+            yield lease
+        finally:
+            lease.release()
+
+    @asynccontextmanager
+    async def aslot(self, user_id: str, priority: str = INTERACTIVE, cost: float = 1.0,
+                    reject: Optional[bool] = None) -> AsyncIterator[Lease]:
+        lease = await self.acquire_async(user_id, priority, cost, reject)
+        try:
+            yield lease
+        finally:
+            lease.release()
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                "concurrency": self.concurrency,
+                "bulk_limit":  self.bulk_limit,
+                "running":     dict(self.running),
+                "queued":      {p: self._queued(p) for p in PRIORITIES},
+                "users_queued": len({user for _, user in self.waiting}),
+                "avg_hold_seconds": round(self.hold, 3),
+            }
+
+
+_scheduler: Optional[Scheduler] = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler() -> Scheduler:
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = Scheduler()
+        return _scheduler
@@ -0,0 +1,514 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# === Vector store config ===
+VECTOR_STORE    = os.getenv("VECTOR_STORE", "pinecone")          # "pinecone" or "local"
+LOCAL_STORE_DIR = os.getenv("LOCAL_STORE_DIR", ".cache/vectors")
+INDEX_NAME      = "book-index"
+DIMENSION       = 768
+DELETE_BATCH    = 1000                                              # Pinecone's max ids per delete
+DELETE_WORKERS  = int(os.getenv("DELETE_WORKERS", "4"))
+# Index partitioning: "user" keeps each user's vectors in their own namespace,
+# "book" gives every book its own namespace, "none" keeps everything in the
+# default namespace. "none" is the default, since that is where existing indexes
+# keep their vectors; opt in with `main.py migrate-namespaces` (migrate_namespaces)
+VECTOR_NAMESPACES = os.getenv("VECTOR_NAMESPACES", "none")
+MIGRATE_BATCH     = 100                                             # vectors moved per fetch/upsert/delete round
+# one keep-alive HTTP pool shared by every request; size it to the number of
+# threads that query concurrently (API_RETRIEVAL_WORKERS in api.py)
+PINECONE_POOL_SIZE = int(os.getenv("PINECONE_POOL_SIZE", "64"))
+PINECONE_TIMEOUT   = float(os.getenv("PINECONE_TIMEOUT", "10"))    # seconds per Pinecone call
+
+
+class Match:
+    # One query hit; supports both attribute and dict-style access like Pinecone's.
+    def __init__(self, id: str, score: float, metadata: Optional[dict] = None,
+                 values: Optional[List[float]] = None):
+        self.id       = id
+        self.score    = score
+        self.metadata = metadata or {}
+        self.values   = values
+
+    def __getitem__(self, key):
+        return getattr(self, key)
+
+    def get(self, key, default=None):
+        return getattr(self, key, default)
+
+
+class VectorStore:
+    # Every call works within one namespace ("" is the default one); see namespace_for.
+    # Backends that partition by user and book some other way ignore it.
+    uses_namespaces = True
+    def upsert(self, vectors: List[dict], namespace: str = "") -> None:
+        raise NotImplementedError
+
+    def query(self, vector: List[float], top_k: int, filter: dict,
+              include_metadata: bool = True, include_values: bool = False, namespace: str = "") -> List[Match]:
+        raise NotImplementedError
+
+    def delete(self, ids: List[str], namespace: str = "") -> None:
+        raise NotImplementedError
+
+    def delete_namespace(self, namespace: str) -> bool:
+        # drops a whole namespace in one call; False if the backend can't
+        return False
+
+    def list_ids(self, prefix: str = "", namespace: str = "") -> Iterator[List[str]]:
+        # yields pages of vector ids starting with `prefix`
+        raise NotImplementedError
+
+    def fetch(self, ids: List[str], include_values: bool = False, namespace: str = "") -> Dict[str, Match]:
+        # vectors by id in one round-trip; unknown ids are left out
+        raise NotImplementedError
+
+    def ping(self) -> None:
+        # raises if the backend is unreachable
+        pass
+
+    def delete_batched(self, ids: List[str], batch_size: int = DELETE_BATCH,
+                       workers: int = DELETE_WORKERS, namespace: str = "") -> int:
+        batches = [ids[i:i + batch_size] for i in range(0, len(ids), batch_size)]
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            list(pool.map(lambda batch: self.delete(batch, namespace=namespace), batches))
+        return len(ids)
+
+
+# === Namespaces ===
+def namespace_for(user_id: str, book_name: str) -> str:
+    # the namespace holding a book's vectors, so a query only scans one user's
+    # library (or one book) however many users share the index
+    if VECTOR_NAMESPACES == "user":
+        return user_id
+    if VECTOR_NAMESPACES == "book":
+        return f"{user_id}/{book_name}"
+    return ""
+
+
+def user_namespace(user_id: str) -> str:
+    # where all of a user's vectors can be listed: their namespace in "user"
+    # mode, else the default one (books not yet migrated)
+    return user_id if VECTOR_NAMESPACES == "user" else ""
+
+
+# === Deterministic chunk ids ===
+def chunk_id_prefix(user_id: str, book_name: str) -> str:
+    return f"{user_id}-{book_name}-chunk-"
+
+
+def chunk_id(user_id: str, book_name: str, i: int) -> str:
+    return f"{chunk_id_prefix(user_id, book_name)}{i}"
+
+
+def chunk_index(id_: str) -> Optional[int]:
+    # i of "{user}-{book}-chunk-{i}", None for ids outside the scheme
+    _, sep, i = id_.rpartition("-chunk-")
+    return int(i) if sep and i.isdigit() else None
+
+
+def delete_book_vectors(store: VectorStore, user_id: str, book_name: str,
+                        chunk_count: Optional[int] = None) -> Tuple[int, float]:
+    # Removes every chunk of a book and returns (vectors deleted, seconds taken).
+    # With a known chunk count (Catalog.chunk_extent, which covers chunks committed
+    # by an interrupted re-index) the ids are generated from the id scheme; otherwise
+    # they are enumerated by prefix, with no top_k cap either way.
+    # A book with a namespace of its own is dropped with a single call.
+    started = time.monotonic()
+    namespace = namespace_for(user_id, book_name)
+    if chunk_count is not None and VECTOR_NAMESPACES == "book" and store.delete_namespace(namespace):
+        return chunk_count, time.monotonic() - started
+    if chunk_count is not None:
+        ids = [chunk_id(user_id, book_name, i) for i in range(chunk_count)]
+    else:
+        ids = [id_ for page in store.list_ids(prefix=chunk_id_prefix(user_id, book_name), namespace=namespace)
+               for id_ in page]
+    deleted = store.delete_batched(ids, namespace=namespace) if ids else 0
+    return deleted, time.monotonic() - started
+
+
+def migrate_namespaces(store: VectorStore, source: str = "", batch_size: int = MIGRATE_BATCH,
+                       on_batch=None) -> Tuple[int, int, Dict[Tuple[str, str], int]]:
+    # Moves the vectors of namespace `source` (by default the shared default
+    # namespace) into their namespace_for() namespace, batch_size at a time:
+    # fetch, upsert into the target namespaces, then delete from the source. A
+    # vector is deleted only once it is stored in its target, so an interrupted
+    # migration is resumed by running it again. Vectors without user_id and
+    # book_name metadata, or already in place, are left where they are.
+    # Returns (moved, skipped, vectors moved per (user, book));
+    # on_batch(moved, skipped) reports progress.
+    moved = skipped = 0
+    books: Dict[Tuple[str, str], int] = {}
+    if not store.uses_namespaces:
+        return moved, skipped, books
+    for page in store.list_ids(namespace=source):
+        for i in range(0, len(page), batch_size):
+            found = store.fetch(page[i:i + batch_size], include_values=True, namespace=source)
+            groups: Dict[str, List[dict]] = {}
+            for id_, m in found.items():
+                user_id, book_name = m.metadata.get("user_id"), m.metadata.get("book_name")
+                target = namespace_for(user_id, book_name) if user_id and book_name else source
+                if target == source:
+                    skipped += 1
+                    continue
+                groups.setdefault(target, []).append({"id": id_, "values": list(m.values), "metadata": m.metadata})
+                books[(user_id, book_name)] = books.get((user_id, book_name), 0) + 1
+            for target, vectors in groups.items():
+                store.upsert(vectors, namespace=target)
+            done = [v["id"] for vectors in groups.values() for v in vectors]
+            if done:
+                store.delete(done, namespace=source)
+            moved += len(done)
+            if on_batch:
+                on_batch(moved, skipped)
+    return moved, skipped, books
+
+
+# === Pinecone backend ===
+class PineconeStore(VectorStore):
+    # The client is built and the index verified (or created) on first use rather
+    # than at construction, so startup never waits on, or fails with, Pinecone.
+    # A successful connection is kept; a failed one is retried on the next call.
+    def __init__(self):
+        self.api_key = os.getenv("PINECONE_API_KEY")
+        self.env     = os.getenv("PINECONE_ENVIRONMENT")
+        self.cloud   = os.getenv("PINECONE_CLOUD")
+        self.region  = os.getenv("PINECONE_REGION")
+        if not all([self.api_key, self.env, self.cloud, self.region]):
+            raise RuntimeError("One or more Pinecone vars missing in .env")
+        self._index = None
+        self._lock  = threading.Lock()
+
+    @property
+    def index(self):
+        with self._lock:
+            if self._index is None:
+                self._index = self._connect()
+            return self._index
+
+    def _connect(self):
+        from pinecone import Pinecone, ServerlessSpec
+        from pinecone.openapi_support.exceptions import PineconeApiException
+
+        pc = Pinecone(api_key=self.api_key, environment=self.env, timeout=PINECONE_TIMEOUT,
+                      connection_pool_maxsize=PINECONE_POOL_SIZE)
+        try:
+            if INDEX_NAME not in pc.list_indexes().names():
+                pc.create_index(
+                    name=INDEX_NAME,
+                    vector_type="dense",
+                    dimension=DIMENSION,
+                    metric="cosine",
+                    spec=ServerlessSpec(cloud=self.cloud, region=self.region),
+                    deletion_protection="disabled"
+                )
+        except PineconeApiException as e:
+            if getattr(e, "status", None) != 409:        # 409: created concurrently
+                raise
+        return pc.Index(INDEX_NAME)
+
+    def ping(self) -> None:
+        self.index.describe_index_stats()
+
+    def upsert(self, vectors: List[dict], namespace: str = "") -> None:
+        self.index.upsert(vectors=vectors, namespace=namespace)
+
+    def query(self, vector, top_k, filter, include_metadata=True, include_values=False, namespace=""):
+        res = self.index.query(
+            vector=list(vector),
+            top_k=top_k,
+            include_metadata=include_metadata,
+            include_values=include_values,
+            filter=filter,
+            namespace=namespace
+        )
+        return [
+            Match(m.id, m.score, m.metadata if include_metadata else None,
+                  m.values if include_values else None)
+            for m in res.matches
+        ]
+
+    def delete(self, ids: List[str], namespace: str = "") -> None:
+        if ids:
+            self.index.delete(ids=ids, namespace=namespace)
+
+    def delete_namespace(self, namespace: str) -> bool:
+        if not namespace:
+            return False                    # never wipe the shared default namespace
+        self.index.delete(delete_all=True, namespace=namespace)
+        return True
+
+    def list_ids(self, prefix: str = "", namespace: str = ""):
+        for page in self.index.list(prefix=prefix, namespace=namespace):
+            yield list(page)
+
+    def fetch(self, ids, include_values=False, namespace=""):
+        if not ids:
+            return {}
+        res = self.index.fetch(ids=list(ids), namespace=namespace)
+        return {
+            id_: Match(id_, 0.0, v.metadata, v.values if include_values else None)
+            for id_, v in res.vectors.items()
+        }
+
+
+# === Local NumPy/mmap backend ===
+def _sanitize(name: str) -> str:
+    return "".join(c if c.isalnum() or c in "-_." else "_" for c in name)
+
+
+def safe_name(name: str) -> str:
+    # filesystem-safe, collision-free file/directory name
+    return f"{_sanitize(name)[:64]}-{hashlib.sha1(name.encode('utf-8')).hexdigest()[:8]}"
+
+
+class _LocalBook:
+    # One book's vectors: a float32 (n, DIMENSION) memmap of unit-normalized rows
+    # plus a JSON sidecar with ids and metadata in row order.
+    def __init__(self, path: str):
+        self.path      = path
+        self.mat_path  = os.path.join(path, "vectors.f32")
+        self.meta_path = os.path.join(path, "meta.json")
+        self.lock      = threading.Lock()
+        self.ids: List[str] = []
+        self.meta: List[dict] = []
+        self.rows: Dict[str, int] = {}
+        self.mat: Optional[np.ndarray] = None
+        if os.path.exists(self.meta_path):
+            with open(self.meta_path, encoding="utf-8") as f:
+                data = json.load(f)
+            self.ids, self.meta = data["ids"], data["metadata"]
+            self.rows = {id_: i for i, id_ in enumerate(self.ids)}
+            self._map()
+
+    def _map(self) -> None:
+        self.mat = np.memmap(self.mat_path, dtype=np.float32, mode="r+", shape=(len(self.ids), DIMENSION)) \
+            if self.ids else None
+
+    def _save_meta(self) -> None:
+        tmp = self.meta_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"ids": self.ids, "metadata": self.meta}, f)
+        os.replace(tmp, self.meta_path)
+
+    def upsert(self, vectors: List[dict]) -> None:
+        values = np.asarray([v["values"] for v in vectors], dtype=np.float32)
+        norms  = np.linalg.norm(values, axis=1, keepdims=True)
+        values = values / np.where(norms == 0, 1, norms)
+        with self.lock:
+            os.makedirs(self.path, exist_ok=True)
+            new_rows = []
+            for v, row in zip(vectors, values):
+                i = self.rows.get(v["id"])
+                if i is None:
+                    self.rows[v["id"]] = len(self.ids)
+                    self.ids.append(v["id"])
+                    self.meta.append(v.get("metadata", {}))
+                    new_rows.append(row)
+                else:
+                    self.mat[i] = row
+                    self.meta[i] = v.get("metadata", {})
+            if self.mat is not None:
+                self.mat.flush()
+            if new_rows:
+                with open(self.mat_path, "ab") as f:
+                    f.write(np.asarray(new_rows, dtype=np.float32).tobytes())
+            self._map()
+            self._save_meta()
+
+    def delete(self, ids: List[str]) -> int:
+        doomed = set(ids)
+        with self.lock:
+            keep = [i for i, id_ in enumerate(self.ids) if id_ not in doomed]
+            removed = len(self.ids) - len(keep)
+            if not removed:
+                return 0
+            mat = np.array(self.mat[keep]) if keep else np.zeros((0, DIMENSION), np.float32)
+            self.mat = None
+            with open(self.mat_path, "wb") as f:
+                f.write(mat.tobytes())
+            self.ids  = [self.ids[i] for i in keep]
+            self.meta = [self.meta[i] for i in keep]
+            self.rows = {id_: i for i, id_ in enumerate(self.ids)}
+            self._map()
+            self._save_meta()
+            return removed
+
+    def search(self, q: np.ndarray, top_k: int, where: dict):
+        with self.lock:
+            if self.mat is None:
+                return []
+            scores = self.mat @ q
+            if where:
+                mask = np.fromiter(
+                    (all(m.get(k) == v for k, v in where.items()) for m in self.meta),
+                    dtype=bool, count=len(self.meta)
+                )
+                scores = np.where(mask, scores, -np.inf)
+            k = min(top_k, len(scores))
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+            return [(float(scores[i]), self.ids[i], self.meta[i], self.mat[i]) for i in top
+                    if scores[i] != -np.inf]
+
+
+class LocalStore(VectorStore):
+    # Vectors live under LOCAL_STORE_DIR/<user>/<book>/ so a filtered query only
+    # touches the matrices of the books it can match. That layout already
+    # partitions by user and book, so namespaces are accepted and ignored.
+    uses_namespaces = False
+
+    def __init__(self, root: str = LOCAL_STORE_DIR):
+        self.root  = root
+        self.books: Dict[str, _LocalBook] = {}
+        self.lock  = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    def _book_at(self, path: str) -> _LocalBook:
+        with self.lock:
+            if path not in self.books:
+                self.books[path] = _LocalBook(path)
+            return self.books[path]
+
+    def _book(self, user_id: str, book_name: str) -> _LocalBook:
+        return self._book_at(os.path.join(self.root, safe_name(user_id), safe_name(book_name)))
+
+    def _dirs(self, path: str) -> List[str]:
+        # subdirectories only: stray files in the store are ignored
+        return [os.path.join(path, d) for d in os.listdir(path) if os.path.isdir(os.path.join(path, d))]
+
+    def _all_books(self) -> Iterator[_LocalBook]:
+        for user_dir in self._dirs(self.root):
+            for d in self._dirs(user_dir):
+                yield self._book_at(d)
+
+    def _user_books(self, prefix: str) -> List[_LocalBook]:
+        # books of the users whose ids can start with `prefix`, picked by the readable
+        # part of their directory names; callers still filter ids on the prefix
+        wanted = _sanitize(prefix)
+        books  = []
+        for user_dir in self._dirs(self.root):
+            readable = os.path.basename(user_dir).rsplit("-", 1)[0]
+            n = min(len(readable), len(wanted))
+            if readable[:n] == wanted[:n]:
+                books += [self._book_at(d) for d in self._dirs(user_dir)]
+        return books
+
+    def _prefix_books(self, prefix: str) -> List[_LocalBook]:
+        # the book(s) holding ids "{user}-{book}-chunk-*": a user id may contain "-", so
+        # each split is tried against the directories that exist. When two splits
+        # both exist their ids collide and both are returned.
+        body = prefix[:-len("-chunk-")]
+        paths = [os.path.join(self.root, safe_name(body[:k]), safe_name(body[k + 1:]))
+                 for k, c in enumerate(body) if c == "-"]
+        return [self._book_at(path) for path in paths if os.path.isdir(path)]
+
+    def _locate(self, ids: List[str]) -> Dict[str, Tuple[_LocalBook, List[str]]]:
+        # {book path: (book, ids that may be in it)}, looked up from the id prefixes;
+        # only ids outside the "{user}-{book}-chunk-{i}" scheme need a scan of the store
+        by_prefix: Dict[str, List[str]] = {}
+        stray: List[str] = []
+        for id_ in ids:
+            if chunk_index(id_) is None:
+                stray.append(id_)
+            else:
+                by_prefix.setdefault(id_[:id_.rindex("-chunk-") + len("-chunk-")], []).append(id_)
+        located: Dict[str, Tuple[_LocalBook, List[str]]] = {}
+        for prefix, group in by_prefix.items():
+            for book in self._prefix_books(prefix):
+                located.setdefault(book.path, (book, []))[1].extend(group)
+        if stray:
+            for book in self._all_books():
+                located.setdefault(book.path, (book, []))[1].extend(stray)
+        return located
+
+    def _books_for(self, filter: dict) -> List[_LocalBook]:
+        user_id, book_name = filter.get("user_id"), filter.get("book_name")
+        if user_id is None:
+            raise ValueError("LocalStore queries must filter on user_id")
+        if book_name is not None:
+            return [self._book(user_id, book_name)]
+        user_dir = os.path.join(self.root, safe_name(user_id))
+        if not os.path.isdir(user_dir):
+            return []
+        return [self._book_at(d) for d in self._dirs(user_dir)]
+
+    def upsert(self, vectors: List[dict], namespace: str = "") -> None:
+        groups: Dict[tuple, List[dict]] = {}
+        for v in vectors:
+            md = v.get("metadata", {})
+            groups.setdefault((md["user_id"], md["book_name"]), []).append(v)
+        for (user_id, book_name), group in groups.items():
+            self._book(user_id, book_name).upsert(group)
+
+    def query(self, vector, top_k, filter, include_metadata=True, include_values=False, namespace=""):
+        q = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(q)
+        q = q / norm if norm else q
+        where = {k: v for k, v in filter.items() if k not in ("user_id", "book_name")}
+        hits = []
+        for book in self._books_for(filter):
+            hits.extend(book.search(q, top_k, where))
+        hits.sort(key=lambda h: -h[0])
+        return [
+            Match(id_, score, dict(md) if include_metadata else None,
+                  row.tolist() if include_values else None)
+            for score, id_, md, row in hits[:top_k]
+        ]
+
+    def delete_batched(self, ids, batch_size=DELETE_BATCH, workers=DELETE_WORKERS, namespace=""):
+        # a local delete rewrites the book's matrix once, so batching would only add passes
+        return self.delete(ids)
+
+    def delete(self, ids: List[str], namespace: str = "") -> int:
+        removed = 0
+        for book, book_ids in self._locate(ids).values():
+            if set(book_ids).intersection(book.rows):
+                removed += book.delete(book_ids)
+                if not book.ids:
+                    with self.lock:
+                        self.books.pop(book.path, None)
+                    shutil.rmtree(book.path, ignore_errors=True)
+        return removed
+
+    def fetch(self, ids, include_values=False, namespace=""):
+        found: Dict[str, Match] = {}
+        for book, book_ids in self._locate(list(ids)).values():
+            with book.lock:
+                for id_ in set(book_ids).intersection(book.rows):
+                    i = book.rows[id_]
+                    found[id_] = Match(id_, 0.0, dict(book.meta[i]),
+                                       book.mat[i].tolist() if include_values else None)
+        return found
+
+    def ping(self) -> None:
+        if not os.path.isdir(self.root):
+            raise RuntimeError(f"Local store directory '{self.root}' is missing")
+
+    def list_ids(self, prefix: str = "", namespace: str = ""):
+        for book in self._user_books(prefix):
+            page = [id_ for id_ in book.ids if id_.startswith(prefix)]
+            if page:
+                yield page
+
+
+_store: Optional[VectorStore] = None
+_store_lock = threading.Lock()
+
+
+def get_store() -> VectorStore:
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = LocalStore() if VECTOR_STORE == "local" else PineconeStore()
+        return _store